@@ -1,48 +1,94 @@
 # agent.py
 
-import json
 import re
-import ast
-from ollama_client import chat
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from ollama_client import chat_stream
+from tool_parser import ToolCallParser, normalize_tool_call
+from memory import ConversationMemory
+import tracing
 from tools import get_search_results, summarize_paper, compare_papers, analyze_citations
-from config import OLLAMA_MODEL
+from config import (
+    OLLAMA_MODEL,
+    TOOL_MAX_WORKERS,
+    TOOL_TIMEOUT,
+    SPECULATIVE_RETRIEVAL,
+    SPECULATIVE_MATCH_THRESHOLD,
+)
 
-def extract_json(text: str) -> dict:
+RUN_FINAL_INSTRUCTION = (
+    "Based on all the information gathered so far, please now generate a final, polished answer "
+    "to the original question in plain text. The answer should be concise, well-organized, "
+    "and visually appealing, without any internal processing details."
+)
+CONVERSE_FINAL_INSTRUCTION = (
+    "Based on everything so far, please now provide a final, conversational answer to the original question. "
+    "The answer should be clear, engaging, and free of any internal processing details."
+)
+
+def token_jaccard(a: str, b: str) -> float:
     """
-    Attempt to extract a JSON object from the provided text.
-    
-    1. Try json.loads directly.
-    2. If that fails, remove extraneous quotes/backticks and then
-       repeatedly append a closing brace ("}") (up to 5 times) and try again.
-    3. If still unsuccessful, try ast.literal_eval as a fallback.
-    
-    Returns an empty dict if all attempts fail.
+    Jaccard similarity of the lowercase word sets of a and b.
     """
-    text = text.strip()
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
+    words_a = set(re.findall(r"\w+", a.lower()))
+    words_b = set(re.findall(r"\w+", b.lower()))
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
 
-    text = text.strip("`\"")
-    attempt = text
-    for i in range(5):
-        try:
-            return json.loads(attempt)
-        except json.JSONDecodeError:
-            attempt += "}"
-    try:
-        result = ast.literal_eval(attempt)
-        if isinstance(result, dict):
-            return result
-    except Exception:
-        pass
-    return {}
+_speculation_executor = None
+_speculation_lock = threading.Lock()
+
+def _speculation_pool() -> ThreadPoolExecutor:
+    global _speculation_executor
+    with _speculation_lock:
+        if _speculation_executor is None:
+            _speculation_executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS,
+                                                       thread_name_prefix="agent-speculative")
+        return _speculation_executor
+
+class SpeculativeSearch:
+    """
+    A get_search_results call for the raw user query, started before the model
+    has asked for it. take() hands the future to the first matching search call,
+    under whichever tool name (e.g. "search_papers") the model used for it.
+    """
+    def __init__(self, query: str, future, search_function):
+        self.query = query
+        self.future = future
+        self.search_function = search_function
+        self.used = False
+
+    def take(self, tool_function, tool_args: dict):
+        """
+        Returns the future if this call is a search close enough to the speculated query, else None.
+        """
+        if (self.used or tool_function is not self.search_function
+                or not isinstance(tool_args.get("query"), str)):
+            return None
+        if token_jaccard(self.query, tool_args["query"]) < SPECULATIVE_MATCH_THRESHOLD:
+            return None
+        self.used = True
+        return self.future
+
+    def discard(self):
+        """
+        Ends the speculation; an unused search is cancelled if it has not started yet.
+        """
+        tracing.count("agent_speculative_retrieval_total", outcome="used" if self.used else "discarded")
+        if not self.used:
+            self.future.cancel()
 
 class Agent:
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, speculative_retrieval: bool = SPECULATIVE_RETRIEVAL):
         self.model_name = model_name
+        # Start retrieval for the user's query while the first model call runs.
+        self.speculative_retrieval = speculative_retrieval
         self.conversation = []  # List of messages (each with "role" and "content")
+        # Keeps the conversation within CONTEXT_TOKEN_BUDGET tokens per chat() call.
+        self.memory = ConversationMemory()
         
         # System instruction to tell the assistant how to handle tool calls.
         system_instructions = (
@@ -140,84 +186,177 @@ class Agent:
             },
         ]
 
+    def _context(self) -> list:
+        """
+        Compacts the conversation to the memory's token budget before a chat() call.
+        """
+        self.conversation = self.memory.compact(self.conversation)
+        return self.conversation
+
+    def _tool_name_and_args(self, tool_call: dict, user_query: str):
+        """
+        Normalizes a tool call to (name, arguments) (see tool_parser.normalize_tool_call).
+        """
+        tool_name, tool_args = normalize_tool_call(tool_call)
+        # Fallback for required parameters: if "text" is missing for functions that need it, use the original query.
+        if tool_name in ["analyze_citations", "summarize_paper"]:
+            if "text" not in tool_args or not tool_args["text"]:
+                tool_args["text"] = user_query
+        return tool_name, tool_args
+
+    def _call_tool(self, tool_name: str, tool_args: dict, user_query: str) -> str:
+        tool_function = self.tool_mapping[tool_name]
+        with tracing.span("tool.call", tool=tool_name) as span:
+            try:
+                result = tool_function(**tool_args)
+            except TypeError:
+                # If an error occurs (e.g., missing argument), use the original query as fallback.
+                tool_args["text"] = user_query
+                result = tool_function(**tool_args)
+            span.set(result_chars=len(result or ""))
+            return result
+
+    def _speculate(self, user_query: str):
+        """
+        Starts the speculative search for this turn, or returns None when disabled.
+        """
+        if not self.speculative_retrieval or "get_search_results" not in self.tool_mapping:
+            return None
+        future = _speculation_pool().submit(contextvars.copy_context().run, self._call_tool,
+                                            "get_search_results", {"query": user_query}, user_query)
+        return SpeculativeSearch(user_query, future, self.tool_mapping["get_search_results"])
+
+    def _dispatch_step(self, user_query: str, tools: list, speculation: SpeculativeSearch = None):
+        """
+        Streams one tool-selection round trip and starts each tool call on a
+        thread (at most TOOL_MAX_WORKERS at a time) as soon as its JSON object is
+        complete, rather than after the model finishes generating. Calls to
+        unknown tools are skipped, and a search matching the turn's speculative
+        search reuses its result.
+
+        Yields a tool_start event per call and returns (executor, calls), where
+        calls lists (name, future, submitted) in the order the model made them.
+        """
+        parser = ToolCallParser()
+        executor = None
+        calls = []
+        # Captured before the model call starts, so tool spans nest under the turn rather than the call.
+        context = contextvars.copy_context()
+
+        def start(tool_call):
+            nonlocal executor
+            tool_name, tool_args = self._tool_name_and_args(tool_call, user_query)
+            if tool_name not in self.tool_mapping:
+                return None
+            future = speculation.take(self.tool_mapping[tool_name], tool_args) if speculation else None
+            if future is None:
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=TOOL_MAX_WORKERS, thread_name_prefix="agent-tool")
+                future = executor.submit(context.copy().run, self._call_tool, tool_name, tool_args, user_query)
+            calls.append((tool_name, future, time.monotonic()))
+            return {"type": "tool_start", "name": tool_name, "arguments": tool_args}
+
+        try:
+            for chunk in chat_stream(model=self.model_name, messages=self._context(), tools=tools,
+                                     priority="normal"):
+                content = chunk.get("message", {}).get("content", "") or chunk.get("content", "")
+                tool_calls = parser.feed(content or "")
+                # Native tool calls arrive whole in a single chunk.
+                tool_calls += chunk.get("tool_calls") or []
+                for tool_call in tool_calls:
+                    event = start(tool_call)
+                    if event:
+                        yield event
+            for tool_call in parser.finish():
+                event = start(tool_call)
+                if event:
+                    yield event
+        except BaseException:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        return executor, calls
+
+    def _collect(self, calls: list):
+        """
+        Yields (name, result) for the started calls in order. A call that does not
+        finish within TOOL_TIMEOUT seconds of being started yields a timeout message
+        instead of stalling the turn.
+        """
+        for tool_name, future, submitted in calls:
+            timeout = None
+            if TOOL_TIMEOUT is not None:
+                timeout = max(0.0, submitted + TOOL_TIMEOUT - time.monotonic())
+            try:
+                tool_result = future.result(timeout=timeout)
+            except FuturesTimeoutError:
+                future.cancel()
+                tool_result = f"Tool {tool_name} timed out after {TOOL_TIMEOUT} seconds."
+            yield tool_name, tool_result
+
+    def stream(self, user_query: str, final_instruction: str = RUN_FINAL_INSTRUCTION):
+        """
+        Processes a query and yields events as they happen:
+
+          - {"type": "tool_start", "name": ..., "arguments": ...} before a tool runs
+          - {"type": "tool_end", "name": ..., "result": ...} after it returns
+          - {"type": "token", "content": ...} for each piece of the final answer
+          - {"type": "final", "content": ...} with the complete final answer, last
+        """
+        with tracing.span("agent.turn", model=self.model_name, query_chars=len(user_query)) as turn:
+            self.conversation.append({"role": "user", "content": user_query})
+            speculation = self._speculate(user_query)
+            try:
+                # Only the first round trip offers the tool schemas; later ones may still request tools.
+                tools = self.tools_schema
+                rounds = tools_run = 0
+                while True:
+                    executor, calls = yield from self._dispatch_step(user_query, tools, speculation)
+                    tools = None
+                    if not calls:
+                        break
+                    try:
+                        for tool_name, tool_result in self._collect(calls):
+                            self.conversation.append({"role": "tool", "content": tool_result})
+                            yield {"type": "tool_end", "name": tool_name, "result": tool_result}
+                    finally:
+                        if executor is not None:
+                            # Don't wait for timed-out calls; they finish (and are discarded) in the background.
+                            executor.shutdown(wait=False, cancel_futures=True)
+                    rounds += 1
+                    tools_run += len(calls)
+            finally:
+                if speculation is not None:
+                    speculation.discard()
+                    turn.set(speculation_used=speculation.used)
+
+            self.conversation.append({"role": "system", "content": final_instruction})
+            parts = []
+            for chunk in chat_stream(model=self.model_name, messages=self._context(), priority="interactive"):
+                token = chunk.get("message", {}).get("content", "") or chunk.get("content", "")
+                if token:
+                    parts.append(token)
+                    yield {"type": "token", "content": token}
+            answer = "".join(parts).strip()
+            turn.set(tool_rounds=rounds, tool_calls=tools_run, answer_chars=len(answer))
+        yield {"type": "final", "content": answer}
+
     def run(self, user_query: str) -> str:
         """
         One-shot method: processes a single query and returns a clean, final answer.
         This method appends the user's query to the conversation, processes any internal tool calls,
         and finally instructs the assistant to generate a polished answer.
         """
-        self.conversation.append({"role": "user", "content": user_query})
-        response = chat(model=self.model_name, messages=self.conversation, tools=self.tools_schema)
-        content = response.get("message", {}).get("content", "")
-        structured = extract_json(content)
-        tool_calls = response.get("tool_calls", structured.get("tool_calls", []))
-        if isinstance(tool_calls, dict):
-            tool_calls = [tool_calls]
-        if not tool_calls and "tools" in response:
-            tool_calls = []
-            for tool in response["tools"]:
-                if isinstance(tool, dict) and "function_name" in tool:
-                    tool_calls.append(tool)
-                elif isinstance(tool.get("function"), dict) and "name" in tool["function"]:
-                    tool_calls.append(tool["function"])
-        while tool_calls:
-            for tool_call in tool_calls:
-                if "function_name" in tool_call:
-                    tool_name = tool_call["function_name"]
-                    tool_args = tool_call.get("arguments", {})
-                elif isinstance(tool_call.get("function"), dict):
-                    tool_name = tool_call["function"].get("name")
-                    tool_args = tool_call["function"].get("arguments", {})
-                elif "name" in tool_call:
-                    tool_name = tool_call.get("name")
-                    tool_args = tool_call.get("parameters", {})
-                else:
-                    tool_name = tool_call.get("function")
-                    tool_args = tool_call.get("arguments", {})
-                
-                # Fallback for required parameters: if "text" is missing for functions that need it, use the original query.
-                if tool_name in ["analyze_citations", "summarize_paper"]:
-                    if "text" not in tool_args or not tool_args["text"]:
-                        tool_args["text"] = user_query
-                
-                if tool_name in self.tool_mapping:
-                    tool_function = self.tool_mapping[tool_name]
-                    try:
-                        tool_result = tool_function(**tool_args)
-                    except TypeError as e:
-                        # If an error occurs (e.g., missing argument), use the original query as fallback.
-                        tool_args["text"] = user_query
-                        tool_result = tool_function(**tool_args)
-                    self.conversation.append({"role": "tool", "content": tool_result})
-                # Skip unknown tools silently.
-            response = chat(model=self.model_name, messages=self.conversation)
-            content = response.get("message", {}).get("content", "")
-            structured = extract_json(content)
-            tool_calls = response.get("tool_calls", structured.get("tool_calls", []))
-            if isinstance(tool_calls, dict):
-                tool_calls = [tool_calls]
-            if not tool_calls and "tools" in response:
-                tool_calls = []
-                for tool in response["tools"]:
-                    if isinstance(tool, dict) and "function_name" in tool:
-                        tool_calls.append(tool)
-                    elif isinstance(tool.get("function"), dict) and "name" in tool["function"]:
-                        tool_calls.append(tool["function"])
-        final_instruction = (
-            "Based on all the information gathered so far, please now generate a final, polished answer "
-            "to the original question in plain text. The answer should be concise, well-organized, "
-            "and visually appealing, without any internal processing details."
-        )
-        self.conversation.append({"role": "system", "content": final_instruction})
-        final_response = chat(model=self.model_name, messages=self.conversation)
-        final_answer = (final_response.get("message", {}).get("content", "") or 
-                        final_response.get("content", "")).strip()
+        final_answer = ""
+        for event in self.stream(user_query, RUN_FINAL_INSTRUCTION):
+            if event["type"] == "final":
+                final_answer = event["content"]
         return final_answer
 
     def converse(self):
         """
         Interactive conversational loop. The conversation history is maintained so that the assistant's
-        responses are context-aware.
+        responses are context-aware. Answers are printed as they are generated.
         """
         print("Welcome to the Conversational Research Assistant!")
         print("Type your questions below (or type 'exit' to quit).")
@@ -226,69 +365,26 @@ class Agent:
             if user_input.strip().lower() in ["exit", "quit"]:
                 print("Goodbye!")
                 break
-            self.conversation.append({"role": "user", "content": user_input})
-            response = chat(model=self.model_name, messages=self.conversation, tools=self.tools_schema)
-            content = response.get("message", {}).get("content", "")
-            structured = extract_json(content)
-            tool_calls = response.get("tool_calls", structured.get("tool_calls", []))
-            if isinstance(tool_calls, dict):
-                tool_calls = [tool_calls]
-            if not tool_calls and "tools" in response:
-                tool_calls = []
-                for tool in response["tools"]:
-                    if isinstance(tool, dict) and "function_name" in tool:
-                        tool_calls.append(tool)
-                    elif isinstance(tool.get("function"), dict) and "name" in tool["function"]:
-                        tool_calls.append(tool["function"])
-            while tool_calls:
-                for tool_call in tool_calls:
-                    if "function_name" in tool_call:
-                        tool_name = tool_call["function_name"]
-                        tool_args = tool_call.get("arguments", {})
-                    elif isinstance(tool_call.get("function"), dict):
-                        tool_name = tool_call["function"].get("name")
-                        tool_args = tool_call["function"].get("arguments", {})
-                    elif "name" in tool_call:
-                        tool_name = tool_call.get("name")
-                        tool_args = tool_call.get("parameters", {})
+            answer = ""
+            started = False
+            for event in self.stream(user_input, CONVERSE_FINAL_INSTRUCTION):
+                if event["type"] == "tool_start":
+                    print(f"[Running {event['name']}...]")
+                elif event["type"] == "token":
+                    if not started:
+                        # Leading whitespace is dropped from the final answer, so skip it here too.
+                        if not event["content"].strip():
+                            continue
+                        print("Assistant: ", end="", flush=True)
+                        started = True
+                        print(event["content"].lstrip(), end="", flush=True)
                     else:
-                        tool_name = tool_call.get("function")
-                        tool_args = tool_call.get("arguments", {})
-                    
-                    if tool_name in ["analyze_citations", "summarize_paper"]:
-                        if "text" not in tool_args or not tool_args["text"]:
-                            tool_args["text"] = user_input
-                    if tool_name in self.tool_mapping:
-                        tool_function = self.tool_mapping[tool_name]
-                        try:
-                            tool_result = tool_function(**tool_args)
-                        except TypeError:
-                            tool_args["text"] = user_input
-                            tool_result = tool_function(**tool_args)
-                        self.conversation.append({"role": "tool", "content": tool_result})
-                    # Skip unknown tools silently.
-                response = chat(model=self.model_name, messages=self.conversation)
-                content = response.get("message", {}).get("content", "")
-                structured = extract_json(content)
-                tool_calls = response.get("tool_calls", structured.get("tool_calls", []))
-                if isinstance(tool_calls, dict):
-                    tool_calls = [tool_calls]
-                if not tool_calls and "tools" in response:
-                    tool_calls = []
-                    for tool in response["tools"]:
-                        if isinstance(tool, dict) and "function_name" in tool:
-                            tool_calls.append(tool)
-                        elif isinstance(tool.get("function"), dict) and "name" in tool["function"]:
-                            tool_calls.append(tool["function"])
-            final_instruction = (
-                "Based on everything so far, please now provide a final, conversational answer to the original question. "
-                "The answer should be clear, engaging, and free of any internal processing details."
-            )
-            self.conversation.append({"role": "system", "content": final_instruction})
-            final_response = chat(model=self.model_name, messages=self.conversation)
-            answer = (final_response.get("message", {}).get("content", "") or 
-                      final_response.get("content", "")).strip()
+                        print(event["content"], end="", flush=True)
+                elif event["type"] == "final":
+                    answer = event["content"]
+            if started:
+                print()
             if not answer:
                 answer = "I'm sorry, I didn't quite catch that. Could you please rephrase?"
-            print("Assistant:", answer)
+                print("Assistant:", answer)
             self.conversation.append({"role": "assistant", "content": answer})
@@ -1,10 +1,10 @@
 import streamlit as st
-import warnings
-# Optionally suppress deprecation warnings:
-warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-from agent import Agent
-from config import OLLAMA_MODEL
+from client import ResearchAssistantClient, ServerError
+from config import SERVER_URL
+
+# The agent runs in server.py; this page only renders its events.
+client = ResearchAssistantClient(SERVER_URL)
 
 st.title("Research Assistant")
 st.write("Ask questions about research papers or request summaries, comparisons, and citation analyses.")
@@ -12,14 +12,51 @@ st.write("Ask questions about research papers or request summaries, comparisons,
 # A text input for the user query.
 user_query = st.text_input("Enter your query:")
 
-# When the user clicks "Submit", run the agent and display the answer.
+def render_answer(session_id: str):
+    events = client.stream(user_query, session_id)
+    # The first event confirms the session; errors such as an expired session surface here.
+    next(events)
+    status = st.empty()
+    st.markdown("### Final Answer")
+    answer_box = st.empty()
+    answer = ""
+    # Stream the agent's processing: tool progress first, then the answer token by token.
+    for event in events:
+        if event["type"] == "tool_start":
+            status.info(f"Running {event['name']}...")
+        elif event["type"] == "tool_end":
+            status.info(f"Finished {event['name']}.")
+        elif event["type"] == "token":
+            status.empty()
+            answer += event["content"]
+            answer_box.markdown(answer + "▌")
+        elif event["type"] == "final":
+            answer = event["content"]
+        elif event["type"] == "error":
+            status.error(event["message"])
+    answer_box.markdown(answer)
+
+# When the user clicks "Submit", send the query to the server and display the answer as it is generated.
 if st.button("Submit"):
     if user_query:
-        # Create an instance of the Agent.
-        agent = Agent(model_name=OLLAMA_MODEL)
-        # Run the agent's processing (this uses your run() method that returns a final answer).
-        final_answer = agent.run(user_query)
-        st.markdown("### Final Answer")
-        st.write(final_answer)
+        try:
+            # One server-side session per browser session, so follow-up questions keep their context.
+            if "session_id" not in st.session_state:
+                st.session_state["session_id"] = client.create_session()
+            try:
+                render_answer(st.session_state["session_id"])
+            except ServerError as e:
+                if e.status != 404:
+                    raise
+                # The session expired on the server; start a new one.
+                st.session_state["session_id"] = client.create_session()
+                render_answer(st.session_state["session_id"])
+        except ServerError as e:
+            if e.status == 503:
+                st.warning("The server is busy right now. Please try again in a moment.")
+            else:
+                st.error(f"Server error: {e}")
+        except OSError:
+            st.error(f"Cannot reach the research assistant server at {SERVER_URL}. Start it with `python server.py`.")
     else:
         st.write("Please enter a query.")
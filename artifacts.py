@@ -0,0 +1,542 @@
+# artifacts.py
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import ARTIFACTS_PATH, ARTIFACT_LLM_SUMMARIES, ARTIFACT_ABSTRACT_TOKENS, SUMMARY_MAX_WORKERS
+from tokens import truncate_to_tokens
+
+# Bump whenever extraction changes so that stored artifacts get recomputed.
+ARTIFACTS_VERSION = 1
+# At most this many reference-list entries are kept per paper and listed in a citation report.
+MAX_REFERENCES = 500
+MAX_LISTED_REFERENCES = 40
+# Texts of at most this many words are treated as a question rather than as paper
+# text; longer texts only match a paper whose title is within their first
+# TITLE_WINDOW_CHARS characters.
+QUESTION_WORDS = 60
+TITLE_WINDOW_CHARS = 400
+# A text is taken to refer to a corpus paper without asking the model only if it
+# contains the paper's full normalized title of at least this many words, or
+# names its file.
+MIN_TITLE_WORDS = 4
+# A reference cites a corpus paper when it contains the paper's normalized title;
+# titles shorter than this many words are too ambiguous to be matched.
+CITATION_TITLE_WORDS = 3
+
+_REFERENCES_HEADING = re.compile(
+    r"^[ \t]*(?:\d+\.?[ \t]*|[IVX]+\.[ \t]*)?(?:references|bibliography|works cited|literature cited)[ \t]*:?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE)
+_APPENDIX_HEADING = re.compile(r"^[ \t]*(?:[A-Z]\.?[ \t]+)?(?:appendix|appendices|supplementary material)\b",
+                               re.IGNORECASE | re.MULTILINE)
+_ABSTRACT_HEADING = re.compile(r"^[ \t]*abstract\b[ \t]*[:.\-—]?", re.IGNORECASE | re.MULTILINE)
+_SECTION_HEADING = re.compile(
+    r"^[ \t]*(?:(?:1|I)\.?[ \t]+)?(?:introduction|keywords|index terms|background)\b", re.IGNORECASE | re.MULTILINE)
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+_CITATION_MARKER = re.compile(r"\[\d+(?:\s*[,\u2013-]\s*\d+)*\]|\bet al\b|\([^()]*\b(?:19|20)\d{2}[a-z]?\)")
+_BRACKET_MARKER = re.compile(r"^[ \t]*\[(\d+)\][ \t]*", re.MULTILINE)
+_NUMBER_MARKER = re.compile(r"^[ \t]*(\d{1,3})\.[ \t]+(?=\S)", re.MULTILINE)
+_AUTHOR_YEAR_START = re.compile(r"\n(?=[A-Z][A-Za-z'\-]+,[ \t]+[A-Z])")
+_SENTENCE_END = re.compile(r"(?<=[a-z0-9)\]]{2}[.?!])\s+")
+_QUOTED = re.compile(r"[“\"]([^”\"]{10,300})[”\"]")
+_YEAR = re.compile(r"\b(?:19|20)\d{2}\b")
+# A question about the citation graph of the whole collection, e.g. "Which papers
+# are cited the most?" or "Show the citation graph of the corpus".
+_CORPUS_SCOPE = re.compile(r"\b(?:collection|corpus|library|citation graph|citation network|(?:all|these|my|which|"
+                           r"what) (?:of (?:the|my) )?(?:research )?papers|most cited)\b", re.IGNORECASE)
+_CITATION_WORD = re.compile(r"\bcit(?:e|es|ed|ing|ation|ations)\b|\breferenc(?:e|es|ed|ing)\b", re.IGNORECASE)
+_TITLE_NOISE = re.compile(r"arxiv|preprint|conference|proceedings|journal|workshop|@|https?://|\bvol\b",
+                          re.IGNORECASE)
+
+def normalize(text: str) -> str:
+    """
+    Lower-cases text and reduces it to space-separated alphanumeric words.
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+def extract_title(text: str, filename: str) -> str:
+    """
+    Returns the first line near the top of the paper that looks like a title,
+    or the filename without its extension.
+    """
+    for line in text.splitlines()[:30]:
+        line = line.strip()
+        words = line.split()
+        if 2 <= len(words) <= 30 and len(line) <= 250 and not _TITLE_NOISE.search(line):
+            if sum(ch.isdigit() for ch in line) <= len(line) // 4:
+                return line
+    return os.path.splitext(filename)[0]
+
+def extract_abstract(text: str, max_tokens: int = ARTIFACT_ABSTRACT_TOKENS) -> str:
+    """
+    Returns the paper's abstract, or its opening paragraphs when it has no
+    "Abstract" heading, cut to max_tokens tokens.
+    """
+    references = _REFERENCES_HEADING.search(text)
+    body = text[:references.start()] if references is not None else text
+    heading = _ABSTRACT_HEADING.search(body)
+    if heading is not None:
+        body = body[heading.end():].lstrip()
+        # The abstract ends at the next section heading or paragraph break.
+        ends = [match.start() for match in (_SECTION_HEADING.search(body), _PARAGRAPH_BREAK.search(body)) if match]
+        abstract = body[:min(ends)] if ends else body
+    else:
+        # Skip the title line.
+        abstract = body.split("\n", 1)[1] if "\n" in body else body
+    abstract = re.sub(r"\s+", " ", abstract).strip()
+    return truncate_to_tokens(abstract, max_tokens, marker=" ...") if abstract else ""
+
+def _reference_title(entry: str) -> str:
+    """
+    Guesses the title of a reference: a quoted span if there is one, otherwise
+    the sentence after the author list.
+    """
+    quoted = _QUOTED.search(entry)
+    if quoted is not None:
+        return quoted.group(1).strip(" ,.")
+    sentences = [s.strip() for s in _SENTENCE_END.split(entry) if s.strip()]
+    if len(sentences) >= 2:
+        return sentences[1].rstrip(".")
+    return sentences[0].rstrip(".") if sentences else entry
+
+def _split_entries(section: str) -> list:
+    """
+    Splits a reference section into (label, text) entries, recognizing [n] and
+    "n." numbering, author-year lists and, failing those, one entry per paragraph or line.
+    """
+    for marker, template in ((_BRACKET_MARKER, "[{}]"), (_NUMBER_MARKER, "{}.")):
+        matches = list(marker.finditer(section))
+        if len(matches) >= 2:
+            entries = []
+            for match, following in zip(matches, matches[1:] + [None]):
+                body = section[match.end():following.start() if following else len(section)]
+                entries.append((template.format(match.group(1)), body))
+            return entries
+    parts = _AUTHOR_YEAR_START.split(section)
+    if len(parts) < 2:
+        parts = re.split(r"\n\s*\n", section)
+    if len(parts) < 2:
+        parts = section.splitlines()
+    return [(None, part) for part in parts]
+
+def parse_references(text: str) -> list:
+    """
+    Parses the reference list at the end of a paper into entries of the form
+    {"label", "text", "title", "year"}. Returns an empty list when the paper has
+    no "References"/"Bibliography" heading.
+    """
+    headings = list(_REFERENCES_HEADING.finditer(text))
+    if not headings:
+        return []
+    section = text[headings[-1].end():]
+    appendix = _APPENDIX_HEADING.search(section)
+    if appendix is not None:
+        section = section[:appendix.start()]
+
+    references = []
+    for label, body in _split_entries(section):
+        entry = re.sub(r"\s+", " ", body).strip()
+        if len(entry) < 15:
+            continue
+        year = _YEAR.search(entry)
+        references.append({"label": label, "text": entry, "title": _reference_title(entry),
+                           "year": int(year.group()) if year else None})
+        if len(references) >= MAX_REFERENCES:
+            break
+    return references
+
+def extract_artifacts(filename: str, text: str) -> dict:
+    """
+    Computes the artifacts of one paper that need no model call: its title,
+    abstract and parsed reference list. The abstract doubles as the summary
+    until a model-written one is stored.
+    """
+    abstract = extract_abstract(text)
+    return {
+        "filename": filename,
+        "title": extract_title(text, filename),
+        "abstract": abstract,
+        "summary": abstract,
+        "summary_source": "abstract",
+        "references": parse_references(text),
+    }
+
+class TitleIndex:
+    """
+    The normalized titles (of at least CITATION_TITLE_WORDS words) of a set of
+    papers, keyed by their first CITATION_TITLE_WORDS words, so that finding the
+    titles contained in a reference costs one dictionary lookup per word of the
+    reference instead of a scan over every title.
+    """
+    def __init__(self, titles):
+        self._titles = {}
+        for content_hash, title in titles:
+            words = tuple(normalize(title).split())
+            if len(words) >= CITATION_TITLE_WORDS:
+                self._titles.setdefault(words[:CITATION_TITLE_WORDS], []).append((words, content_hash))
+        # Prefer the most specific title when several match one reference.
+        for candidates in self._titles.values():
+            candidates.sort(key=lambda candidate: -len(candidate[0]))
+        self._longest_words = {max(words, key=len) for candidates in self._titles.values()
+                               for words, _ in candidates}
+
+    def __bool__(self) -> bool:
+        return bool(self._titles)
+
+    def may_match(self, reference: str) -> bool:
+        """
+        Cheap pre-check for a small index: False if reference cannot contain
+        any of the titles, because it lacks the longest word of each.
+        """
+        lowered = reference.lower()
+        return any(word in lowered for word in self._longest_words)
+
+    def match(self, reference: str, exclude: str = None) -> tuple:
+        """
+        Returns (hash, number of title words) of the longest title contained in
+        reference, ignoring the paper with hash exclude, or None.
+        """
+        words = normalize(reference).split()
+        best = None
+        for start in range(len(words) - CITATION_TITLE_WORDS + 1):
+            for title, content_hash in self._titles.get(tuple(words[start:start + CITATION_TITLE_WORDS]), ()):
+                if best is not None and len(title) <= best[1]:
+                    break
+                if content_hash != exclude and tuple(words[start:start + len(title)]) == title:
+                    best = (content_hash, len(title))
+                    break
+        return best
+
+class ArtifactStore:
+    """
+    SQLite sidecar to the index holding each paper's precomputed artifacts,
+    keyed by the SHA-256 of its contents (as in the index manifest), and the
+    citation graph between the papers of the corpus.
+    """
+    def __init__(self, path: str = ARTIFACTS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS papers (hash TEXT PRIMARY KEY, filename TEXT, title TEXT, "
+                         "abstract TEXT, summary TEXT, summary_source TEXT, refs TEXT, version INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS citations "
+                         "(citing TEXT, cited TEXT, reference INTEGER, PRIMARY KEY (citing, cited, reference))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS citations_cited ON citations (cited)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _paper(row) -> dict:
+        content_hash, filename, title, abstract, summary, summary_source, refs = row
+        return {"hash": content_hash, "filename": filename, "title": title, "abstract": abstract,
+                "summary": summary, "summary_source": summary_source, "references": json.loads(refs)}
+
+    def put(self, content_hash: str, artifact: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, artifact["filename"], artifact["title"], artifact["abstract"], artifact["summary"],
+                 artifact["summary_source"], json.dumps(artifact["references"]), ARTIFACTS_VERSION))
+            self._db.commit()
+
+    def get(self, content_hash: str) -> dict:
+        with self._lock:
+            row = self._db.execute("SELECT hash, filename, title, abstract, summary, summary_source, refs "
+                                   "FROM papers WHERE hash = ?", (content_hash,)).fetchone()
+        return self._paper(row) if row else None
+
+    def current_hashes(self) -> set:
+        """
+        Returns the hashes of the papers whose artifacts are up to date with ARTIFACTS_VERSION.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT hash FROM papers WHERE version = ?", (ARTIFACTS_VERSION,)).fetchall()
+        return {content_hash for content_hash, in rows}
+
+    def papers(self) -> list:
+        with self._lock:
+            rows = self._db.execute("SELECT hash, filename, title, abstract, summary, summary_source, refs "
+                                    "FROM papers ORDER BY filename").fetchall()
+        return [self._paper(row) for row in rows]
+
+    def titles(self) -> list:
+        """
+        Returns (hash, filename, title) for every paper, without loading the reference lists.
+        """
+        with self._lock:
+            return self._db.execute("SELECT hash, filename, title FROM papers ORDER BY filename").fetchall()
+
+    def retain(self, hashes: set) -> set:
+        """
+        Drops the artifacts and citation links of papers that are no longer in
+        the corpus; returns their hashes.
+        """
+        with self._lock:
+            stored = {content_hash for content_hash, in self._db.execute("SELECT hash FROM papers")}
+            stale = stored - set(hashes)
+            self._db.executemany("DELETE FROM papers WHERE hash = ?", [(content_hash,) for content_hash in stale])
+            self._db.commit()
+        return stale
+
+    def set_summary(self, content_hash: str, summary: str, source: str):
+        with self._lock:
+            self._db.execute("UPDATE papers SET summary = ?, summary_source = ? WHERE hash = ?",
+                             (summary, source, content_hash))
+            self._db.commit()
+
+    def pending_summaries(self) -> list:
+        """
+        Returns (hash, title, abstract) for the papers without a model-written summary.
+        """
+        with self._lock:
+            return self._db.execute("SELECT hash, title, abstract FROM papers WHERE summary_source != 'llm' "
+                                    "AND abstract != ''").fetchall()
+
+    def update_citations(self, added: set, removed: set = frozenset()) -> int:
+        """
+        Updates the citation graph after the papers in added were (re)stored and
+        those in removed dropped; returns the number of links written. Only the
+        references of added papers are matched against every title. The other
+        papers' references are matched against the added titles alone, and
+        against every title only where they cited a removed or added paper.
+        """
+        titles = {content_hash: title for content_hash, _, title in self.titles()}
+        added = set(added) & set(titles)
+        removed = set(removed) - added
+        index = TitleIndex(titles.items())
+        new_titles = TitleIndex((content_hash, titles[content_hash]) for content_hash in added)
+        title_words = {content_hash: len(normalize(title).split()) for content_hash, title in titles.items()}
+        with self._lock:
+            existing = {(citing, reference): cited for citing, cited, reference
+                        in self._db.execute("SELECT citing, cited, reference FROM citations")}
+
+        # Links to a removed paper, or to one whose title may have changed, are matched again.
+        rematch = removed | added
+        if new_titles or any(cited in rematch for cited in existing.values()):
+            papers = self.papers()
+        else:
+            papers = [self.get(content_hash) for content_hash in added]
+
+        links, stale = [], []
+        for paper in papers:
+            citing = paper["hash"]
+            if citing in added:
+                for position, reference in enumerate(paper["references"]):
+                    match = index.match(reference["text"], exclude=citing)
+                    if match is not None:
+                        links.append((citing, match[0], position))
+                continue
+            for position, reference in enumerate(paper["references"]):
+                cited = existing.get((citing, position))
+                if cited in rematch:
+                    stale.append((citing, position))
+                    match = index.match(reference["text"], exclude=citing)
+                elif new_titles:
+                    if not new_titles.may_match(reference["text"]):
+                        continue
+                    match = new_titles.match(reference["text"], exclude=citing)
+                    if match is not None and cited is not None:
+                        if match[1] <= title_words.get(cited, 0):
+                            continue
+                        stale.append((citing, position))
+                else:
+                    continue
+                if match is not None:
+                    links.append((citing, match[0], position))
+
+        with self._lock:
+            self._db.executemany("DELETE FROM citations WHERE citing = ? OR cited = ?",
+                                 [(content_hash, content_hash) for content_hash in removed])
+            self._db.executemany("DELETE FROM citations WHERE citing = ?", [(citing,) for citing in added])
+            self._db.executemany("DELETE FROM citations WHERE citing = ? AND reference = ?", stale)
+            self._db.executemany("INSERT OR IGNORE INTO citations VALUES (?, ?, ?)", links)
+            self._db.commit()
+        return len(links)
+
+    def cites(self, content_hash: str) -> list:
+        """
+        Returns (cited hash, reference index) for the corpus papers that a paper cites.
+        """
+        with self._lock:
+            return self._db.execute("SELECT cited, reference FROM citations WHERE citing = ? ORDER BY reference",
+                                    (content_hash,)).fetchall()
+
+    def cited_by(self, content_hash: str) -> list:
+        """
+        Returns the hashes of the corpus papers citing a paper.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT citing FROM citations WHERE cited = ?",
+                                    (content_hash,)).fetchall()
+        return [citing for citing, in rows]
+
+    def most_cited(self, limit: int = 10) -> list:
+        """
+        Returns (hash, number of citing papers) for the most cited papers of the corpus.
+        """
+        with self._lock:
+            return self._db.execute("SELECT cited, COUNT(DISTINCT citing) AS n FROM citations GROUP BY cited "
+                                    "ORDER BY n DESC, cited LIMIT ?", (limit,)).fetchall()
+
+_store = None
+_store_lock = threading.Lock()
+_summary_lock = threading.Lock()
+_summary_thread = None
+_summary_thread_lock = threading.Lock()
+
+def get_store() -> ArtifactStore:
+    """
+    Returns the process-wide artifact store.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
+
+def summarize_pending(store: ArtifactStore = None, max_workers: int = SUMMARY_MAX_WORKERS) -> int:
+    """
+    Writes a model summary for every paper that only has its abstract as summary;
+    returns the number written. Each paper is summarized once, from its title and
+    abstract, at background priority.
+    """
+    from summarization import complete
+
+    store = store or get_store()
+    with _summary_lock:
+        pending = store.pending_summaries()
+
+        def summarize(item):
+            content_hash, title, abstract = item
+            summary = complete("Summarize the following research paper in a concise paragraph, "
+                               f"based on its title and abstract:\n\nTitle: {title}\n\n{abstract}")
+            if summary.strip():
+                store.set_summary(content_hash, summary.strip(), "llm")
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifact-summaries") as executor:
+            list(executor.map(summarize, pending))
+        return len(pending)
+
+def start_background_summaries(store: ArtifactStore = None):
+    """
+    Runs summarize_pending() on a daemon thread unless one is already running.
+    """
+    global _summary_thread
+    if not ARTIFACT_LLM_SUMMARIES:
+        return
+    with _summary_thread_lock:
+        if _summary_thread is not None and _summary_thread.is_alive():
+            return
+
+        def run():
+            try:
+                summarize_pending(store)
+            except Exception as e:
+                print(f"Artifact summaries failed: {e}", file=sys.stderr)
+
+        _summary_thread = threading.Thread(target=run, name="artifact-summaries", daemon=True)
+        _summary_thread.start()
+
+_FILENAME_TOKEN = re.compile(r"[\w\-]+(?:\.[\w\-]+)*")
+
+def _filename_names(filename: str) -> list:
+    """
+    Returns the lower-cased names by which a text can refer to a file: the
+    filename itself, and its stem when that looks like a filename rather than
+    a word (it contains a digit or a separator next to letters).
+    """
+    stem = os.path.splitext(filename)[0]
+    names = [filename.lower()]
+    if re.search(r"[A-Za-z]", stem) and re.search(r"[\d_.\-]", stem):
+        names.append(stem.lower())
+    return names
+
+def resolve_paper(text: str, store: ArtifactStore = None) -> tuple:
+    """
+    Returns the (hash, filename, title) of the corpus paper that text refers to,
+    or None. A text refers to a paper if it names the paper's file or contains
+    its full title of at least MIN_TITLE_WORDS words; a longer text (paper text
+    passed in by the model) must do so within its first TITLE_WINDOW_CHARS
+    characters. Anything weaker, e.g. a short title that also reads as a topic,
+    is left to the model.
+    """
+    store = store or get_store()
+    if len(text.split()) > QUESTION_WORDS:
+        text = text[:TITLE_WINDOW_CHARS]
+    normalized = f" {normalize(text)} "
+    tokens = {token.lower() for token in _FILENAME_TOKEN.findall(text)}
+    best, best_length = None, 0
+    for paper in store.titles():
+        _, filename, title = paper
+        if any(name in tokens for name in _filename_names(filename)):
+            return paper
+        name = normalize(title)
+        if len(name.split()) >= MIN_TITLE_WORDS and len(name) > best_length and f" {name} " in normalized:
+            best, best_length = paper, len(name)
+    return best
+
+def _paper_line(store: ArtifactStore, content_hash: str) -> str:
+    paper = store.get(content_hash)
+    return f"{paper['title']} ({paper['filename']})" if paper else content_hash[:12]
+
+def paper_summary(text: str, store: ArtifactStore = None) -> str:
+    """
+    Returns the stored summary of the paper text refers to, or None.
+    """
+    store = store or get_store()
+    resolved = resolve_paper(text, store)
+    if resolved is None:
+        return None
+    paper = store.get(resolved[0])
+    if not paper or not paper["summary"]:
+        return None
+    return f"Summary of \"{paper['title']}\" ({paper['filename']}):\n{paper['summary']}"
+
+def citation_report(text: str, store: ArtifactStore = None) -> str:
+    """
+    Answers a citation question from the stored reference lists and citation
+    graph, or returns None if it needs a model call. For a paper of the corpus
+    (see resolve_paper), lists its references and its citation links to other
+    corpus papers. A short question explicitly about the citations of the
+    collection as a whole gets an overview of the corpus citation graph. Any
+    other text returns None.
+    """
+    store = store or get_store()
+    resolved = resolve_paper(text, store)
+    if resolved is not None:
+        paper = store.get(resolved[0])
+        cites = store.cites(paper["hash"])
+        cited_by = store.cited_by(paper["hash"])
+        lines = [f"Citation analysis of \"{paper['title']}\" ({paper['filename']}), "
+                 f"from its parsed reference list:",
+                 f"- {len(paper['references'])} references, {len(cites)} of them to papers in this collection."]
+        for cited, index in cites:
+            label = paper["references"][index]["label"] or f"#{index + 1}"
+            lines.append(f"  - {label} {_paper_line(store, cited)}")
+        lines.append(f"- Cited by {len(cited_by)} papers in this collection.")
+        lines.extend(f"  - {_paper_line(store, citing)}" for citing in cited_by)
+        if paper["references"]:
+            lines.append("References:")
+            for index, reference in enumerate(paper["references"][:MAX_LISTED_REFERENCES]):
+                lines.append(f"{reference['label'] or f'{index + 1}.'} {reference['text']}")
+            if len(paper["references"]) > MAX_LISTED_REFERENCES:
+                lines.append(f"... and {len(paper['references']) - MAX_LISTED_REFERENCES} more.")
+        return "\n".join(lines)
+
+    if (len(text.split()) > QUESTION_WORDS or _CITATION_MARKER.search(text) or not _CORPUS_SCOPE.search(text)
+            or not _CITATION_WORD.search(text) or not store.titles()):
+        return None
+    most_cited = store.most_cited()
+    lines = [f"Citation graph of the {len(store.titles())} papers in this collection:"]
+    if most_cited:
+        lines.append("Most cited within the collection:")
+        lines.extend(f"- {_paper_line(store, content_hash)}: cited by {count} papers"
+                     for content_hash, count in most_cited)
+    else:
+        lines.append("No paper in the collection cites another one.")
+    return "\n".join(lines)
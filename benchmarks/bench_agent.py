@@ -0,0 +1,171 @@
+# benchmarks/bench_agent.py
+#
+# End-to-end, fully offline benchmark of Agent.run(): a scripted stand-in for
+# Ollama, deterministic stub embeddings and synthetic corpora of increasing size.
+# Run from the repository root:
+#
+#   python -m benchmarks.bench_agent --sizes 10,100,1000 --queries 50 --output bench_agent.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.harness import (
+    TOOL_PATTERNS,
+    StageTimer,
+    ScriptedOllamaBackend,
+    StubEmbeddings,
+    peak_rss_mb,
+    write_corpus,
+)
+
+def _configure(workdir: str, store: str, dim: int, backend):
+    """
+    Points the retriever, artifact store, embeddings, LLM cache and Ollama
+    client at the benchmark's working directory and stand-ins.
+    """
+    import retriever
+    import artifacts
+    import embeddings
+    import llm_cache
+    import ollama_client
+
+    retriever.RESEARCH_PAPERS_DIR = os.path.join(workdir, "papers")
+    retriever.INDEX_DIR = os.path.join(workdir, "index")
+    retriever.MANIFEST_PATH = os.path.join(retriever.INDEX_DIR, "manifest.json")
+    retriever.CHROMA_DIR = os.path.join(retriever.INDEX_DIR, "chroma")
+    retriever.NUMPY_DIR = os.path.join(retriever.INDEX_DIR, "numpy")
+    retriever.VECTOR_STORE = store
+    retriever._vectorstore = None
+    retriever._retriever = None
+    artifacts._store = artifacts.ArtifactStore(os.path.join(retriever.INDEX_DIR, "artifacts.sqlite3"))
+    # Background paper summaries would compete with the measured turns for the model.
+    artifacts.ARTIFACT_LLM_SUMMARIES = False
+
+    embeddings.EMBEDDING_BACKEND = "stub"
+    embeddings._embeddings["stub"] = embeddings.CachedEmbeddings(
+        StubEmbeddings(dim), path=os.path.join(workdir, "embeddings.sqlite3"))
+    llm_cache._cache = llm_cache.ResponseCache(directory=os.path.join(workdir, "llm"))
+
+    ollama_client.register_backend("scripted", lambda: backend)
+    ollama_client.set_backend("scripted")
+
+def _run_query(query: str, timer: StageTimer, speculative: bool = False):
+    from agent import Agent
+    from config import OLLAMA_MODEL
+
+    agent = Agent(model_name=OLLAMA_MODEL, speculative_retrieval=speculative)
+    agent.tool_mapping = {name: timer.timed(f"tool.{function.__name__}", function)
+                          for name, function in agent.tool_mapping.items()}
+    started = time.perf_counter()
+    first_token = None
+    for event in agent.stream(query):
+        if event["type"] == "token" and first_token is None:
+            first_token = time.perf_counter()
+            timer.record("turn.time_to_first_token", first_token - started)
+    finished = time.perf_counter()
+    if first_token is not None:
+        timer.record("final_answer", finished - first_token)
+    timer.record("turn", finished - started)
+
+def run_size(papers: int, args) -> dict:
+    import tools
+    import retriever
+
+    workdir = tempfile.mkdtemp(prefix="bench-agent-")
+    try:
+        write_corpus(os.path.join(workdir, "papers"), papers, paragraphs=args.paragraphs, seed=args.seed)
+        timer = StageTimer()
+        backend = ScriptedOllamaBackend(pattern=args.pattern, prompt_latency=args.prompt_latency,
+                                        token_latency=args.token_latency, answer_tokens=args.answer_tokens,
+                                        timer=timer)
+        _configure(workdir, args.store, args.dim, backend)
+
+        started = time.perf_counter()
+        retriever.get_retriever()
+        ingest_seconds = time.perf_counter() - started
+        # The first search after indexing pays the store's cold start; keep it out of "retrieval".
+        timer.timed("retrieval.first_query", retriever.retrieve_documents)("warm-up query")
+
+        original_retrieve = tools.retrieve_documents
+        tools.retrieve_documents = timer.timed("retrieval", original_retrieve)
+        try:
+            queries = [f"What does paper {i % papers} report about term{i}?" for i in range(args.queries)]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(lambda query: _run_query(query, timer, args.speculative), queries))
+            wall = time.perf_counter() - started
+        finally:
+            tools.retrieve_documents = original_retrieve
+
+        return {
+            "papers": papers,
+            "ingest": {"seconds": round(ingest_seconds, 3),
+                       "papers_per_second": round(papers / ingest_seconds, 1) if ingest_seconds else 0.0},
+            "queries": args.queries,
+            "throughput_qps": round(args.queries / wall, 3),
+            "stages": timer.summary(),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(results: list):
+    for result in results:
+        print(f"\n== {result['papers']} papers: ingest {result['ingest']['seconds']}s "
+              f"({result['ingest']['papers_per_second']} papers/s), "
+              f"{result['throughput_qps']} queries/s, peak RSS {result['peak_rss_mb']} MB")
+        print(f"{'stage':<28}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}")
+        for stage, stats in result["stages"].items():
+            print(f"{stage:<28}{stats['count']:>7}{stats['p50_ms']:>11}{stats['p95_ms']:>11}{stats['max_ms']:>11}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the research agent.")
+    parser.add_argument("--sizes", default="10,100,500", help="Comma-separated corpus sizes (papers).")
+    parser.add_argument("--paragraphs", type=int, default=20, help="Paragraphs per synthetic paper.")
+    parser.add_argument("--queries", type=int, default=20, help="Agent turns per corpus size.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Turns run in parallel.")
+    parser.add_argument("--pattern", default="search+summarize", choices=sorted(TOOL_PATTERNS),
+                        help="Tool calls the scripted model makes on each turn.")
+    parser.add_argument("--prompt-latency", type=float, default=0.05, help="Seconds per scripted model call.")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Seconds per generated token.")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="Tokens in each final answer.")
+    parser.add_argument("--store", default="chroma", choices=["chroma", "numpy"])
+    parser.add_argument("--speculative", action="store_true",
+                        help="Start retrieval for the user's query alongside the first model call.")
+    parser.add_argument("--dim", type=int, default=256, help="Stub embedding dimension.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_agent.json", help="Machine-readable results file.")
+    args = parser.parse_args(argv)
+
+    results = [run_size(int(size), args) for size in args.sizes.split(",") if size.strip()]
+    print_report(results)
+    report = {
+        "benchmark": "agent",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# benchmarks/bench_tool_parser.py
+#
+# Compares the incremental tool-call parser (tool_parser.py) with the previous
+# parse-after-generation approach on well-formed, malformed and very long model
+# outputs. Run from the repository root:
+#
+#   python -m benchmarks.bench_tool_parser --repeats 20 --output bench_tool_parser.json
+
+import sys
+import ast
+import json
+import time
+import argparse
+
+from tool_parser import ToolCallParser, normalize_tool_call
+
+def legacy_extract_json(text: str) -> dict:
+    """
+    The agent's former extract_json(): json.loads, then up to five appended "}",
+    then ast.literal_eval.
+    """
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    text = text.strip("`\"")
+    attempt = text
+    for i in range(5):
+        try:
+            return json.loads(attempt)
+        except json.JSONDecodeError:
+            attempt += "}"
+    try:
+        result = ast.literal_eval(attempt)
+        if isinstance(result, dict):
+            return result
+    except Exception:
+        pass
+    return {}
+
+def legacy_parse(text: str) -> list:
+    """
+    The agent's former _parse_tool_calls() applied to a content-only response.
+    """
+    structured = legacy_extract_json(text)
+    if not isinstance(structured, dict):
+        return []
+    tool_calls = structured.get("tool_calls", [])
+    if isinstance(tool_calls, dict):
+        tool_calls = [tool_calls]
+    return tool_calls
+
+def incremental_parse(text: str, token_chars: int = 4):
+    """
+    Feeds text to a ToolCallParser in token-sized pieces. Returns the calls and
+    the fraction of the output consumed when the first call was emitted.
+    """
+    parser = ToolCallParser()
+    calls, first_at = [], None
+    for i in range(0, len(text), token_chars):
+        found = parser.feed(text[i:i + token_chars])
+        if found and first_at is None:
+            first_at = min(1.0, (i + token_chars) / len(text))
+        calls += found
+    found = parser.finish()
+    if found and first_at is None:
+        first_at = 1.0
+    return calls + found, first_at
+
+def _call(name: str, **arguments) -> dict:
+    return {"name": name, "parameters": arguments}
+
+def cases(long_chars: int) -> dict:
+    """
+    Returns {case name: (model output, expected tool names)}.
+    """
+    search = _call("get_search_results", query="main contribution of the transformer paper")
+    summarize = _call("summarize_paper", text="Attention is all you need. " * 20)
+    long_text = _call("summarize_paper", text=("Lorem ipsum dolor sit amet, consectetur \"adipiscing\" elit. "
+                                               * (long_chars // 60 + 1))[:long_chars])
+    many = [_call("get_search_results", query=f"topic {i}") for i in range(200)]
+    nested = {"function": {"name": "compare_papers", "arguments": {"text1": {"a": {"b": "x"}}, "text2": "y"}}}
+    tools = [{"function_name": "analyze_citations", "arguments": {"text": "[1] A."}},
+             {"function": {"name": "get_search_results", "arguments": {"query": "q"}}}]
+    standard = json.dumps({"tool_calls": [search, summarize]})
+    return {
+        "well_formed": (standard, ["get_search_results", "summarize_paper"]),
+        "code_fence_and_prose": ("Sure, I'll look that up.\n```json\n" + standard + "\n```\nLet me know!",
+                                 ["get_search_results", "summarize_paper"]),
+        "truncated_in_string": (standard[:-30], ["get_search_results", "summarize_paper"]),
+        "missing_six_closers": (json.dumps({"tool_calls": [search, nested]})[:-6],
+                                ["get_search_results", "compare_papers"]),
+        "python_literal": (repr({"tool_calls": [search, summarize]}), ["get_search_results", "summarize_paper"]),
+        "tools_shape": (json.dumps({"tools": tools}), ["analyze_citations", "get_search_results"]),
+        "bare_call": (json.dumps(search), ["get_search_results"]),
+        "long_argument": (json.dumps({"tool_calls": [search, long_text]}),
+                          ["get_search_results", "summarize_paper"]),
+        "many_calls": (json.dumps({"tool_calls": many}), ["get_search_results"] * len(many)),
+        "plain_answer": ("The paper introduces the Transformer, built entirely on attention.", []),
+    }
+
+def _time(function, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+def run(args) -> list:
+    results = []
+    for name, (text, expected) in cases(args.long_chars).items():
+        legacy_calls = legacy_parse(text)
+        calls, first_at = incremental_parse(text, args.token_chars)
+        incremental_ms = 1000 * _time(lambda: incremental_parse(text, args.token_chars), args.repeats)
+        tokens = max(1, -(-len(text) // args.token_chars))
+        legacy_names = [normalize_tool_call(call)[0] for call in legacy_calls if isinstance(call, dict)]
+        names = [normalize_tool_call(call)[0] for call in calls]
+        results.append({
+            "case": name,
+            "chars": len(text),
+            "expected_calls": len(expected),
+            "legacy": {"correct": legacy_names == expected,
+                       "calls": len(legacy_names),
+                       "parse_ms": round(1000 * _time(lambda: legacy_parse(text), args.repeats), 3)},
+            "incremental": {"correct": names == expected,
+                            "calls": len(names),
+                            "parse_ms": round(incremental_ms, 3),
+                            "us_per_token": round(1000 * incremental_ms / tokens, 3),
+                            "first_call_at": round(first_at, 3) if first_at is not None else None},
+        })
+    return results
+
+def print_report(results: list):
+    print(f"{'case':<24}{'chars':>9}{'legacy ok':>11}{'legacy ms':>11}{'incr. ok':>10}{'incr. ms':>10}"
+          f"{'us/token':>10}{'1st call at':>13}")
+    for r in results:
+        first = r["incremental"]["first_call_at"]
+        print(f"{r['case']:<24}{r['chars']:>9}{str(r['legacy']['correct']):>11}{r['legacy']['parse_ms']:>11}"
+              f"{str(r['incremental']['correct']):>10}{r['incremental']['parse_ms']:>10}"
+              f"{r['incremental']['us_per_token']:>10}"
+              f"{(f'{first:.0%}' if first is not None else '-'):>13}")
+    print("\n'1st call at' is the share of the output generated when the first call could be dispatched;"
+          " the legacy parser always needs 100%. 'us/token' is the incremental parser's cost per streamed"
+          " token, to compare with the model's time per token.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the streaming tool-call parser.")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per case (median reported).")
+    parser.add_argument("--token-chars", type=int, default=4, help="Characters per streamed token.")
+    parser.add_argument("--long-chars", type=int, default=200_000, help="Size of the long tool argument.")
+    parser.add_argument("--output", default=None, help="Optional JSON results file.")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"benchmark": "tool_parser", "parameters": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# benchmarks/bench_vector_store.py
+#
+# Compares query throughput and memory of the Chroma and NumPy vector stores on a
+# synthetic corpus. Run from the repository root:
+#
+#   python -m benchmarks.bench_vector_store --chunks 50000 --queries 500 --ivf-lists 64
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+import numpy as np
+
+from embeddings import HashingEmbeddings
+
+class _Embeddings:
+    """
+    Uncached hashing embeddings with the LangChain interface, shared by both stores.
+    """
+    def __init__(self, dim: int):
+        self.backend = HashingEmbeddings(dim)
+        self.name = self.backend.name
+
+    def embed_documents(self, texts: list) -> list:
+        return self.backend.embed_batch(texts).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self.backend.embed_batch([text])[0].tolist()
+
+def synthetic_texts(count: int, words_per_text: int = 80, vocabulary: int = 5000, seed: int = 0) -> list:
+    """
+    Returns `count` reproducible pseudo-documents drawn from a Zipf-like vocabulary.
+    """
+    rng = np.random.default_rng(seed)
+    words = [f"w{i:05d}" for i in range(vocabulary)]
+    ranks = np.minimum(rng.zipf(1.3, size=(count, words_per_text)), vocabulary) - 1
+    return [" ".join(words[i] for i in row) for row in ranks]
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _rss_mb() -> float:
+    """
+    Current resident set size; falls back to the peak where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+def _open_store(kind: str, directory: str, embeddings, ivf_lists: int):
+    if kind == "chroma":
+        from langchain_community.vectorstores import Chroma
+        return Chroma(collection_name="bench", embedding_function=embeddings, persist_directory=directory)
+    from vector_store import NumpyVectorStore
+    return NumpyVectorStore(directory, embeddings, ivf_lists=ivf_lists if kind == "numpy-ivf" else 0)
+
+def _run_store(kind: str, args, result_queue):
+    from retriever import upsert_chunks
+
+    embeddings = _Embeddings(args.dim)
+    texts = synthetic_texts(args.chunks, seed=args.seed)
+    queries = synthetic_texts(args.queries, words_per_text=8, seed=args.seed + 1)
+    vectors = embeddings.backend.embed_batch(texts)
+    baseline_mb = _rss_mb()
+
+    directory = tempfile.mkdtemp(prefix=f"bench-{kind}-")
+    try:
+        store = _open_store(kind, directory, embeddings, args.ivf_lists)
+        started = time.perf_counter()
+        for start in range(0, len(texts), 1000):
+            end = start + 1000
+            upsert_chunks(store, [f"chunk-{i}" for i in range(start, min(end, len(texts)))],
+                          texts[start:end], [{"source": "synthetic"}] * len(texts[start:end]),
+                          vectors[start:end].tolist())
+        build_seconds = time.perf_counter() - started
+
+        retriever = store.as_retriever(search_kwargs={"k": args.k})
+        # Warm-up (also trains the IVF quantizer) before timing.
+        retriever.get_relevant_documents(queries[0])
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            retriever.get_relevant_documents(query)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        result_queue.put({
+            "store": kind,
+            "chunks": args.chunks,
+            "build_seconds": round(build_seconds, 3),
+            "qps": round(len(latencies) / sum(latencies), 1),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "store_rss_mb": round(_rss_mb() - baseline_mb, 1),
+        })
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Chroma and NumPy vector stores.")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--ivf-lists", type=int, default=0,
+                        help="Also benchmark the numpy store with this many IVF lists.")
+    parser.add_argument("--stores", default="chroma,numpy",
+                        help="Comma-separated stores to run (chroma, numpy).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    kinds = [kind.strip() for kind in args.stores.split(",") if kind.strip()]
+    if args.ivf_lists:
+        kinds.append("numpy-ivf")
+
+    # Each store runs in a fresh process so memory numbers don't bleed into each other.
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for kind in kinds:
+        result_queue = context.Queue()
+        process = context.Process(target=_run_store, args=(kind, args, result_queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{kind}: failed (exit code {process.exitcode})", file=sys.stderr)
+            continue
+        results.append(result_queue.get())
+
+    columns = ["store", "chunks", "build_seconds", "qps", "p50_ms", "p95_ms", "store_rss_mb"]
+    print("  ".join(f"{column:>13}" for column in columns))
+    for result in results:
+        print("  ".join(f"{result[column]:>13}" for column in columns))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# benchmarks/harness.py
+#
+# Offline stand-ins used by the benchmarks: a scripted Ollama backend, deterministic
+# embeddings and synthetic paper corpora.
+
+import os
+import sys
+import json
+import time
+import hashlib
+import resource
+import threading
+import numpy as np
+
+# Tool calls the scripted model makes on its first round trip of a turn.
+TOOL_PATTERNS = {
+    "none": [],
+    "search": ["get_search_results"],
+    "search+summarize": ["get_search_results", "summarize_paper"],
+    "multi": ["get_search_results", "get_search_results", "get_search_results", "summarize_paper"],
+}
+
+class StageTimer:
+    """
+    Thread-safe collection of latency samples per stage.
+    """
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def timed(self, stage: str, function):
+        """
+        Wraps function so every call is recorded under stage.
+        """
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        return wrapper
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {stage: latency_summary(values) for stage, values in sorted(self.samples.items())}
+
+def percentile(values: list, q: float) -> float:
+    """
+    Nearest-rank percentile of values (q in 0..100).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(np.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+def latency_summary(values: list) -> dict:
+    """
+    Returns count, mean, p50, p95 and max of latency samples, in milliseconds.
+    """
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "max_ms": round(1000 * max(values), 3) if values else 0.0,
+    }
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class ScriptedOllamaBackend:
+    """
+    A local stand-in for the Ollama backends (see ollama_client.register_backend).
+
+    The first call of a turn (the one offered tool schemas) answers with the tool
+    calls of `pattern`; later calls in the tool loop answer without tool calls;
+    tool-internal prompts get a short canned completion; final answers stream
+    `answer_tokens` tokens. Every call sleeps for prompt_latency plus
+    token_latency per generated token, approximating a local model.
+    """
+    def __init__(self, pattern: str = "search", prompt_latency: float = 0.05, token_latency: float = 0.002,
+                 answer_tokens: int = 60, timer: StageTimer = None):
+        self.tool_names = TOOL_PATTERNS[pattern]
+        self.prompt_latency = prompt_latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.timer = timer or StageTimer()
+
+    def _sleep(self, tokens: int):
+        time.sleep(self.prompt_latency + tokens * self.token_latency)
+
+    def _stage(self, payload: dict) -> str:
+        messages = payload.get("messages", [])
+        if payload.get("tools"):
+            return "chat.tool_selection"
+        if messages and messages[-1]["role"] == "tool":
+            return "chat.tool_followup"
+        if len(messages) == 1 and messages[0]["role"] == "user":
+            return "chat.tool_internal"
+        return "chat.other"
+
+    def _content(self, stage: str, payload: dict) -> str:
+        if stage == "chat.tool_selection":
+            query = payload["messages"][-1]["content"]
+            calls = [{"name": name, "parameters": {"query": query} if name == "get_search_results" else {}}
+                     for name in self.tool_names]
+            return json.dumps({"tool_calls": calls})
+        return "Noted." if stage == "chat.tool_followup" else "A short canned completion. " * 5
+
+    def chat(self, payload: dict) -> dict:
+        started = time.perf_counter()
+        stage = self._stage(payload)
+        content = self._content(stage, payload)
+        self._sleep(len(content) // 4)
+        self.timer.record(stage, time.perf_counter() - started)
+        return {"message": {"role": "assistant", "content": content}, "done": True}
+
+    def stream(self, payload: dict):
+        """
+        Streams the final answer as `answer_tokens` tokens, and the responses of
+        the tool loop in four-character tokens.
+        """
+        started = time.perf_counter()
+        stage = self._stage(payload)
+        if stage == "chat.other":
+            stage = "chat.final_stream"
+            tokens = [f"token{i} " for i in range(self.answer_tokens)]
+        else:
+            content = self._content(stage, payload)
+            tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+        time.sleep(self.prompt_latency)
+        for token in tokens:
+            time.sleep(self.token_latency)
+            yield {"message": {"role": "assistant", "content": token}, "done": False}
+        yield {"message": {"role": "assistant", "content": ""}, "done": True}
+        self.timer.record(stage, time.perf_counter() - started)
+
+    def preload(self, model: str, keep_alive=None):
+        pass
+
+class StubEmbeddings:
+    """
+    Deterministic, dependency-free embeddings: each text maps to a unit vector
+    seeded by its SHA-256, so runs are reproducible and cost almost nothing.
+    """
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"stub-{dim}"
+
+    def embed_batch(self, texts: list) -> np.ndarray:
+        matrix = np.empty((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            matrix[row] = np.random.default_rng(seed).standard_normal(self.dim)
+        return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+_TOPICS = ["transformers", "graph networks", "retrieval", "diffusion", "reinforcement learning",
+           "contrastive learning", "speech recognition", "protein folding", "quantization", "federated learning"]
+
+def write_corpus(directory: str, papers: int, paragraphs: int = 20, seed: int = 0) -> list:
+    """
+    Writes `papers` synthetic .txt papers (title, sections, references) to directory
+    and returns their paths. The same arguments always produce the same files.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    vocabulary = [f"term{i}" for i in range(2000)]
+    paths = []
+    for paper in range(papers):
+        topic = _TOPICS[paper % len(_TOPICS)]
+        title = f"Paper {paper}: Advances in {topic}"
+        lines = [title, "", "Abstract", f"We study {topic} and report new results.", ""]
+        for paragraph in range(paragraphs):
+            words = rng.choice(vocabulary, size=60)
+            lines.append(f"Section {paragraph}. In {topic}, " + " ".join(words) + ".")
+            lines.append("")
+        lines.append("References")
+        for ref in rng.choice(papers, size=min(5, papers), replace=False):
+            lines.append(f"[{ref}] Paper {ref}: Advances in {_TOPICS[ref % len(_TOPICS)]}.")
+        path = os.path.join(directory, f"paper_{paper:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        paths.append(path)
+    return paths
@@ -0,0 +1,84 @@
+# client.py
+
+import json
+import http.client
+from urllib.parse import urlsplit
+
+from config import SERVER_URL
+
+class ServerError(RuntimeError):
+    """
+    Raised when the API server answers with an error status.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class ResearchAssistantClient:
+    """
+    A small synchronous client for server.py.
+    """
+    def __init__(self, base_url: str = SERVER_URL, timeout: float = 600):
+        parts = urlsplit(base_url if "://" in base_url else "http://" + base_url)
+        self.netloc = parts.netloc
+        self.https = parts.scheme == "https"
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, payload: dict = None):
+        """
+        Sends a request and returns (connection, response); raises ServerError on error statuses.
+        """
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        conn = connection_class(self.netloc, timeout=self.timeout)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json", "Connection": "close"}
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        if resp.status >= 400:
+            data = resp.read()
+            conn.close()
+            try:
+                message = json.loads(data).get("error", "")
+            except ValueError:
+                message = data.decode("utf-8", "replace")
+            raise ServerError(resp.status, message or resp.reason)
+        return conn, resp
+
+    def _json(self, method: str, path: str, payload: dict = None) -> dict:
+        conn, resp = self._request(method, path, payload)
+        try:
+            data = resp.read()
+            return json.loads(data) if data else {}
+        finally:
+            conn.close()
+
+    def health(self) -> dict:
+        return self._json("GET", "/health")
+
+    def create_session(self) -> str:
+        return self._json("POST", "/sessions")["session_id"]
+
+    def delete_session(self, session_id: str):
+        self._json("DELETE", f"/sessions/{session_id}")
+
+    def _query_path(self, session_id: str) -> str:
+        return f"/sessions/{session_id}/query" if session_id else "/query"
+
+    def stream(self, query: str, session_id: str = None):
+        """
+        Yields the agent's events for one turn (see Agent.stream), preceded by a
+        {"type": "session", ...} event and possibly including {"type": "error", ...}.
+        """
+        conn, resp = self._request("POST", self._query_path(session_id), {"query": query, "stream": True})
+        try:
+            for line in resp:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+    def ask(self, query: str, session_id: str = None) -> str:
+        """
+        Runs one turn and returns the final answer.
+        """
+        return self._json("POST", self._query_path(session_id), {"query": query, "stream": False})["answer"]
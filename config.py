@@ -1,8 +1,140 @@
 # config.py
 
+import os
+
 # Name of the Ollama model to use.
 OLLAMA_MODEL = "llama3.1:8b"
 # ollama run llama3.1:8b
 
+# How ollama_client talks to Ollama: "http" (pooled keep-alive connections to
+# the Ollama server) or "subprocess" (one `ollama run` process per call).
+OLLAMA_BACKEND = "http"
+# Fall back to the subprocess backend if the Ollama server cannot be reached.
+OLLAMA_FALLBACK_TO_SUBPROCESS = True
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+# How long the server keeps the model loaded after a request (e.g. "30m", -1 for forever).
+OLLAMA_KEEP_ALIVE = "30m"
+# Maximum number of idle keep-alive connections kept in the pool.
+OLLAMA_POOL_SIZE = 4
+# Seconds to wait for a response from the Ollama server.
+OLLAMA_TIMEOUT = 600
+
+# Model calls in flight at once (see scheduler.py). Match the number of requests
+# the Ollama server processes in parallel (its OLLAMA_NUM_PARALLEL); further
+# calls wait in priority order.
+LLM_MAX_CONCURRENT = int(os.environ.get("OLLAMA_NUM_PARALLEL") or 4)
+
 # Directory where research papers are stored.
 RESEARCH_PAPERS_DIR = "research_papers"
+
+# Directory where the persistent vector index and its manifest are stored.
+INDEX_DIR = "index_store"
+# How often (in seconds) the long-lived retriever re-scans RESEARCH_PAPERS_DIR
+# for added, changed or deleted papers, on a background thread so queries are
+# not held up. Set to None to only index at startup.
+INDEX_REFRESH_SECONDS = 60
+
+# Ingestion pipeline: number of PDF extraction processes (None = all cores),
+# chunks per embedding call, and the bound on each inter-stage queue.
+INGEST_WORKERS = None
+EMBED_BATCH_SIZE = 64
+INGEST_QUEUE_SIZE = 8
+
+# Per-paper artifacts precomputed at ingest time (see artifacts.py): title,
+# abstract, parsed reference list, summary and the citation links between the
+# papers, stored in ARTIFACTS_PATH keyed by content hash. With
+# ARTIFACT_LLM_SUMMARIES the model summarizes each new paper's abstract (or its
+# first ARTIFACT_ABSTRACT_TOKENS tokens) once, in the background; until then the
+# abstract itself serves as the summary.
+ARTIFACTS_PATH = os.path.join(INDEX_DIR, "artifacts.sqlite3")
+ARTIFACT_LLM_SUMMARIES = True
+ARTIFACT_ABSTRACT_TOKENS = 600
+
+# Tool calls requested in one agent step run concurrently on up to
+# TOOL_MAX_WORKERS threads. TOOL_TIMEOUT (seconds, or None to wait forever)
+# bounds how long the agent waits for each call, including time spent queued.
+TOOL_MAX_WORKERS = 4
+TOOL_TIMEOUT = 120
+
+# Speculative retrieval: start get_search_results for the raw user query as soon
+# as a turn begins, overlapping it with the first model call. The result is used
+# if the model then asks for a search whose query has at least
+# SPECULATIVE_MATCH_THRESHOLD word overlap (Jaccard) with the user's, and
+# discarded otherwise.
+SPECULATIVE_RETRIEVAL = False
+SPECULATIVE_MATCH_THRESHOLD = 0.5
+
+# Directory for local caches (LLM responses, embeddings, ...).
+CACHE_DIR = ".cache"
+# LLM response cache used by the tools: entries kept in memory, and the size
+# limit (in bytes) of the on-disk tier before the least recently used entries are evicted.
+LLM_CACHE_DIR = os.path.join(CACHE_DIR, "llm")
+LLM_CACHE_MEMORY_ENTRIES = 256
+LLM_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Embedding backend used to index and query papers: "openai" (OpenAIEmbeddings,
+# needs OPENAI_API_KEY and network access) or "hashing" (offline hashed n-gram
+# projection, no network). Changing it rebuilds the index on next use.
+EMBEDDING_BACKEND = "openai"
+# Output dimension of the "hashing" backend.
+EMBEDDING_DIM = 1024
+# Persistent chunk-hash -> vector cache shared by all backends.
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+
+# Vector store backing the index: "chroma" or "numpy" (in-process, memory-mapped
+# float32 matrix; see vector_store.py).
+VECTOR_STORE = "chroma"
+# Number of chunks returned per search.
+RETRIEVER_K = 4
+# Semantic query cache (retriever.py): a query whose embedding has cosine
+# similarity >= QUERY_CACHE_THRESHOLD with a recent query reuses that query's
+# chunks. Tune the threshold per embedding backend; QUERY_CACHE_SIZE = 0 disables it.
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_THRESHOLD = 0.92
+# Retrieved chunks are merged where they overlap, near-duplicates (word-shingle
+# Jaccard >= CONTEXT_DEDUP_THRESHOLD) dropped, and the rest packed best first into
+# RETRIEVAL_CONTEXT_TOKENS tokens (see context_packing.py). None disables the budget.
+RETRIEVAL_CONTEXT_TOKENS = 1000
+CONTEXT_DEDUP_THRESHOLD = 0.8
+# Coarse-quantizer (IVF) lists for the numpy store; 0 scans every row. With
+# IVF enabled, each query scans the NUMPY_IVF_NPROBE closest lists.
+NUMPY_IVF_LISTS = 0
+NUMPY_IVF_NPROBE = 8
+
+# Token budget for the messages sent with each agent chat() call. Keep it below
+# the model's context window (num_ctx) minus room for the answer.
+CONTEXT_TOKEN_BUDGET = 4000
+# Tool results from earlier turns are shortened to this many tokens once the
+# conversation no longer fits the budget.
+STALE_TOOL_RESULT_TOKENS = 200
+# The running summary that replaces the oldest turns is kept to this many tokens.
+CONVERSATION_SUMMARY_TOKENS = 400
+# tiktoken encoding used to count tokens (an approximation for non-OpenAI models).
+TOKENIZER_ENCODING = "cl100k_base"
+
+# Inputs to summarize_paper, compare_papers and analyze_citations longer than
+# this many tokens are split into sections, processed in parallel (at most
+# SUMMARY_MAX_WORKERS model calls at once) and the partial results reduced.
+SUMMARY_SECTION_TOKENS = 3000
+SUMMARY_MAX_WORKERS = 2
+
+# Tracing and metrics (see tracing.py). Disabled by default; set
+# RESEARCH_AGENT_TRACING=1 to enable. Finished spans are appended to TRACE_FILE
+# as JSON lines; set METRICS_PORT to serve Prometheus metrics at /metrics.
+TRACING_ENABLED = os.environ.get("RESEARCH_AGENT_TRACING", "") == "1"
+TRACE_FILE = os.environ.get("RESEARCH_AGENT_TRACE_FILE", "traces.jsonl")
+METRICS_PORT = None
+
+# API server (server.py). At most SERVER_MAX_ACTIVE_TURNS agent turns run at
+# once; up to SERVER_MAX_QUEUED_TURNS more wait up to SERVER_QUEUE_TIMEOUT
+# seconds for a slot, and further requests are rejected with 503. Sessions idle
+# for SERVER_SESSION_TTL seconds are dropped, least recently used first beyond
+# SERVER_MAX_SESSIONS. app.py talks to the server at SERVER_URL.
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_URL = os.environ.get("RESEARCH_AGENT_SERVER", f"http://{SERVER_HOST}:{SERVER_PORT}")
+SERVER_MAX_ACTIVE_TURNS = 8
+SERVER_MAX_QUEUED_TURNS = 32
+SERVER_QUEUE_TIMEOUT = 30
+SERVER_MAX_SESSIONS = 1000
+SERVER_SESSION_TTL = 3600
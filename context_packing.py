@@ -0,0 +1,138 @@
+# context_packing.py
+
+import os
+
+from config import RETRIEVAL_CONTEXT_TOKENS, CONTEXT_DEDUP_THRESHOLD
+from tokens import count_tokens, truncate_to_tokens
+
+# Appended to a passage cut off at the budget.
+TRUNCATION_MARKER = " [...]"
+# Word n-gram size used to compare passages for near-duplicates.
+SHINGLE_SIZE = 3
+# A passage that would get fewer tokens than this of the remaining budget is
+# left out instead of truncated.
+MIN_TRUNCATED_TOKENS = 40
+
+class Passage:
+    """
+    A contiguous span of one source page, built from one or more retrieved chunks.
+    `rank` is the best (lowest) search rank among those chunks.
+    """
+    __slots__ = ("source", "page", "start", "end", "text", "rank", "chunks")
+
+    def __init__(self, source, page, start, text: str, rank: int):
+        self.source = source
+        self.page = page
+        self.start = start
+        self.end = start + len(text) if start is not None else None
+        self.text = text
+        self.rank = rank
+        self.chunks = 1
+
+    def label(self) -> str:
+        name = os.path.basename(self.source) if self.source else "unknown source"
+        if isinstance(self.page, int):
+            # PDF loaders number pages from 0.
+            return f"[{name}, p. {self.page + 1}]"
+        return f"[{name}]"
+
+def merge_chunks(chunks: list) -> list:
+    """
+    Turns (id, text, metadata) chunks, best first, into passages: chunks from
+    the same source and page that overlap or touch (by their "start_index"
+    metadata) are merged back into one contiguous span. Chunks without a start
+    index are kept as they are.
+    """
+    groups = {}
+    passages = []
+    for rank, (_, text, metadata) in enumerate(chunks):
+        metadata = metadata or {}
+        start = metadata.get("start_index")
+        passage = Passage(metadata.get("source"), metadata.get("page"),
+                          start if isinstance(start, int) and start >= 0 else None, text, rank)
+        if passage.start is None:
+            passages.append(passage)
+        else:
+            groups.setdefault((passage.source, passage.page), []).append(passage)
+
+    for group in groups.values():
+        group.sort(key=lambda p: p.start)
+        current = group[0]
+        for passage in group[1:]:
+            if passage.start <= current.end:
+                if passage.end > current.end:
+                    current.text += passage.text[current.end - passage.start:]
+                    current.end = passage.end
+                current.rank = min(current.rank, passage.rank)
+                current.chunks += 1
+            else:
+                passages.append(current)
+                current = passage
+        passages.append(current)
+
+    passages.sort(key=lambda p: p.rank)
+    return passages
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """
+    Returns the set of lower-cased word n-grams in text.
+    """
+    words = text.lower().split()
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def drop_near_duplicates(passages: list, threshold: float = CONTEXT_DEDUP_THRESHOLD) -> list:
+    """
+    Drops passages whose shingle Jaccard similarity with a higher-ranked passage,
+    or whose shingles are almost entirely contained in one, is at least threshold.
+    """
+    kept, kept_shingles = [], []
+    for passage in passages:
+        current = shingles(passage.text)
+        duplicate = False
+        for other in kept_shingles:
+            common = len(current & other)
+            if not common:
+                continue
+            if common / len(current | other) >= threshold or common / len(current) >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(passage)
+            kept_shingles.append(current)
+    return kept
+
+def pack_context(chunks: list, budget_tokens: int = RETRIEVAL_CONTEXT_TOKENS, stats: dict = None) -> str:
+    """
+    Formats retrieved (id, text, metadata) chunks, best first, for the model:
+    overlapping chunks are merged, near-duplicates dropped, and the passages are
+    added in rank order, each under a source/page label, until budget_tokens is
+    reached. The last passage that fits only partly is truncated.
+
+    If stats is given, it is filled in with the chunk, passage and token counts.
+    """
+    passages = merge_chunks(chunks)
+    merged = len(passages)
+    passages = drop_near_duplicates(passages)
+
+    parts = []
+    used = 0
+    for passage in passages:
+        label = passage.label()
+        block = f"{label}\n{passage.text.strip()}"
+        tokens = count_tokens(block)
+        if budget_tokens is not None and used + tokens > budget_tokens:
+            remaining = budget_tokens - used - count_tokens(label + "\n" + TRUNCATION_MARKER)
+            if remaining >= MIN_TRUNCATED_TOKENS:
+                block = f"{label}\n{truncate_to_tokens(passage.text.strip(), remaining, TRUNCATION_MARKER)}"
+                parts.append(block)
+                used += count_tokens(block)
+            break
+        parts.append(block)
+        used += tokens
+
+    if stats is not None:
+        stats.update(chunks=len(chunks), passages=len(parts), merged=len(chunks) - merged,
+                     duplicates=merged - len(passages), context_tokens=used)
+    return "\n\n".join(parts)
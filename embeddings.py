@@ -0,0 +1,172 @@
+# embeddings.py
+
+import os
+import re
+import zlib
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+from config import EMBEDDING_BACKEND, EMBEDDING_DIM, EMBEDDING_CACHE_PATH
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+class HashingEmbeddings:
+    """
+    Offline embeddings: word unigrams, word bigrams and character trigrams are
+    hashed into `dim` signed buckets, damped with a sublinear (log) term
+    frequency and L2-normalized. Needs no model download or network access.
+    """
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> list:
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = list(tokens)
+        features.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        for token in tokens:
+            padded = f"<{token}>"
+            features.extend("#" + padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed_batch(self, texts: list) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix of unit-length embeddings.
+        """
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                rows.append(row)
+                hashes.append(zlib.crc32(feature.encode("utf-8")))
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if hashes:
+            hashes = np.asarray(hashes, dtype=np.uint32)
+            # The low bits pick the bucket, the top bit the sign.
+            signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix, (np.asarray(rows), hashes % self.dim), signs)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+class OpenAIEmbeddingBackend:
+    """
+    OpenAI embeddings through LangChain (requires OPENAI_API_KEY).
+    """
+    def __init__(self):
+        from langchain_community.embeddings import OpenAIEmbeddings
+        self._client = OpenAIEmbeddings()
+        self.name = f"openai-{self._client.model}"
+
+    def embed_batch(self, texts: list) -> np.ndarray:
+        return np.asarray(self._client.embed_documents(texts), dtype=np.float32)
+
+class CachedEmbeddings:
+    """
+    Wraps a backend with a persistent chunk-hash -> vector cache so identical
+    chunks are never embedded twice, across runs and across papers.
+
+    Implements the LangChain embeddings interface (embed_documents / embed_query),
+    so it can be handed to any LangChain vector store.
+    """
+    def __init__(self, backend, path: str = EMBEDDING_CACHE_PATH):
+        self.backend = backend
+        self.name = backend.name
+        self.path = path
+        self._local = threading.local()
+        self.counters = {"hits": 0, "misses": 0}
+        self._counter_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB)")
+
+    def _connection(self):
+        # SQLite connections cannot be shared across threads; keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.name}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_batch(self, texts: list) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix, embedding only cache misses.
+        """
+        keys = [self._key(text) for text in texts]
+        conn = self._connection()
+        cached = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, blob in conn.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({placeholders})", batch):
+                cached[key] = np.frombuffer(blob, dtype=np.float32)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.backend.embed_batch(list(missing.values()))
+            rows = []
+            for key, vector in zip(missing, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                cached[key] = vector
+                rows.append((key, vector.tobytes()))
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)", rows)
+
+        with self._counter_lock:
+            self.counters["misses"] += len(missing)
+            self.counters["hits"] += len(keys) - len(missing)
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([cached[key] for key in keys])
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embed_batch(texts).tolist()
+
+    def embed_query(self, text: str) -> list:
+        # Queries are rarely repeated verbatim; don't grow the cache with them.
+        return self.backend.embed_batch([text])[0].tolist()
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            return dict(self.counters)
+
+# Backend name -> zero-argument factory. Other backends can be added with register_backend().
+_backend_factories = {
+    "hashing": HashingEmbeddings,
+    "openai": OpenAIEmbeddingBackend,
+}
+_embeddings = {}
+_lock = threading.Lock()
+
+def register_backend(name: str, factory):
+    """
+    Registers an embedding backend factory. A backend has a `name` attribute
+    (used in cache keys) and embed_batch(texts) returning a float32 matrix.
+    """
+    with _lock:
+        _backend_factories[name] = factory
+        _embeddings.pop(name, None)
+
+def get_embeddings(name: str = None) -> CachedEmbeddings:
+    """
+    Returns the process-wide cached embeddings for the named backend
+    (default: EMBEDDING_BACKEND from config.py).
+    """
+    name = name or EMBEDDING_BACKEND
+    with _lock:
+        if name not in _embeddings:
+            if name not in _backend_factories:
+                raise ValueError(f"Unknown embedding backend: {name}")
+            _embeddings[name] = CachedEmbeddings(_backend_factories[name]())
+        return _embeddings[name]
@@ -0,0 +1,352 @@
+# ingest.py
+
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from config import INGEST_WORKERS, EMBED_BATCH_SIZE, INGEST_QUEUE_SIZE, ARTIFACT_LLM_SUMMARIES
+
+# Marks the end of a stage's output.
+_DONE = object()
+
+class StageStats:
+    """
+    Item counter, busy time and failed-paper count for one pipeline stage.
+    """
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+        self.failed = 0
+
+    def add(self, items: int, seconds: float):
+        self.items += items
+        self.busy += seconds
+
+    def rate(self, elapsed: float) -> float:
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+def _extract(filepath: str) -> list:
+    """
+    Process-pool worker: parses one paper and returns (page_content, metadata) pairs.
+    Plain tuples are much cheaper to pickle back to the parent than Document objects.
+    """
+    from retriever import load_file
+    return [(doc.page_content, doc.metadata) for doc in load_file(filepath)]
+
+def _extract_artifacts(filename: str, filepath: str) -> dict:
+    """
+    Process-pool worker: parses one paper and returns its artifacts (see artifacts.extract_artifacts).
+    """
+    from artifacts import extract_artifacts
+    return extract_artifacts(filename, "\n".join(text for text, _ in _extract(filepath)))
+
+def _in_pool(pool, function, jobs, arguments):
+    """
+    Submits function(*arguments(job)) to pool for every job, with at most
+    INGEST_QUEUE_SIZE jobs in flight, and yields (job, future, seconds) as they complete.
+    """
+    pending = {}
+    job_iter = iter(jobs)
+    while True:
+        while len(pending) < INGEST_QUEUE_SIZE:
+            job = next(job_iter, None)
+            if job is None:
+                break
+            pending[pool.submit(function, *arguments(job))] = (job, time.perf_counter())
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            job, started = pending.pop(future)
+            yield job, future, time.perf_counter() - started
+
+def extract_paper_artifacts(jobs: list, on_artifact, workers: int = None) -> StageStats:
+    """
+    Extracts the artifacts of already indexed papers (e.g. indexed before an
+    extraction change) without re-chunking or re-embedding them. jobs is a list
+    of (filename, filepath, content_hash) tuples; papers are parsed in a process
+    pool and on_artifact is called with (filename, content_hash, artifact) for
+    each. A paper that fails is skipped with a warning.
+    """
+    workers = workers or INGEST_WORKERS or os.cpu_count() or 1
+    stats = StageStats("extract", "papers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (filename, _, content_hash), future, seconds in _in_pool(pool, _extract_artifacts, jobs,
+                                                                     lambda job: job[:2]):
+            try:
+                artifact = future.result()
+            except Exception as e:
+                stats.failed += 1
+                print(f"Skipping {filename}: extract failed: {e}", file=sys.stderr)
+                continue
+            stats.add(1, seconds)
+            on_artifact(filename, content_hash, artifact)
+    return stats
+
+def run_pipeline(jobs: list, vectorstore, on_file_done=None, progress=None,
+                 workers: int = None, batch_size: int = None, on_document=None, on_file_failed=None) -> dict:
+    """
+    Streams papers through load -> split -> embed -> upsert.
+
+    Parameters:
+      - jobs: a list of (filename, filepath, content_hash) tuples to ingest
+      - vectorstore: the store chunks are upserted into (see retriever.open_vectorstore)
+      - on_file_done: (optional) called with (filename, content_hash, chunk_ids) once
+        every chunk of a paper has been upserted
+      - progress: (optional) called with the list of StageStats and the elapsed time
+      - workers: number of PDF-extraction processes (defaults to INGEST_WORKERS)
+      - batch_size: number of chunks embedded per call (defaults to EMBED_BATCH_SIZE)
+      - on_document: (optional) called from the split stage with (filename, content_hash,
+        full text) of every paper, e.g. to extract per-paper artifacts
+      - on_file_failed: (optional) called with (filename, content_hash, error) for every
+        paper that could not be loaded or split; the paper is skipped and the
+        remaining papers are still ingested. Like on_file_done, it is called on the
+        calling thread, so the two callbacks never run concurrently
+
+    PDF extraction runs in a process pool; splitting and embedding each run in
+    their own thread. Stages are connected by bounded queues so memory stays
+    flat regardless of corpus size.
+
+    Returns:
+      A dictionary mapping each stage name to its StageStats.
+    """
+    from retriever import split_documents, chunk_ids, upsert_chunks
+    from langchain_core.documents import Document
+
+    workers = workers or INGEST_WORKERS or os.cpu_count() or 1
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    stats = {
+        "load": StageStats("load", "papers"),
+        "split": StageStats("split", "chunks"),
+        "embed": StageStats("embed", "chunks"),
+        "upsert": StageStats("upsert", "chunks"),
+    }
+    to_split = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    to_embed = queue.Queue(maxsize=batch_size * INGEST_QUEUE_SIZE)
+    to_upsert = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    errors = []
+    stop = threading.Event()
+
+    def fail(stage, q, filename, content_hash, error):
+        # A single unreadable paper must not abort the run: report it and move on. The
+        # failure is passed down the pipeline so that, like on_file_done, on_file_failed
+        # runs on the upsert thread and the two never update the caller's state concurrently.
+        stats[stage].failed += 1
+        print(f"Skipping {filename}: {stage} failed: {error}", file=sys.stderr)
+        put(q, ("failed", filename, content_hash, error))
+
+    def put(q, item):
+        # Keep retrying so a failing downstream stage cannot deadlock us.
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(q):
+        # Treat a stopped pipeline as end of input once the queue is drained.
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return _DONE
+
+    def load_stage():
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for job, future, seconds in _in_pool(pool, _extract, jobs, lambda job: (job[1],)):
+                    if stop.is_set():
+                        break
+                    try:
+                        pages = future.result()
+                    except Exception as e:
+                        fail("load", to_split, job[0], job[2], e)
+                        continue
+                    stats["load"].add(1, seconds)
+                    put(to_split, (job, pages))
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(to_split, _DONE)
+
+    def split_stage():
+        try:
+            while True:
+                item = get(to_split)
+                if item is _DONE:
+                    break
+                if item[0] == "failed":
+                    put(to_embed, item)
+                    continue
+                started = time.perf_counter()
+                (filename, _, content_hash), pages = item
+                try:
+                    if on_document is not None:
+                        on_document(filename, content_hash, "\n".join(text for text, _ in pages))
+                    documents = [Document(page_content=text, metadata=meta) for text, meta in pages]
+                    chunks = split_documents(documents)
+                except Exception as e:
+                    fail("split", to_embed, filename, content_hash, e)
+                    continue
+                ids = chunk_ids(filename, content_hash, len(chunks))
+                stats["split"].add(len(chunks), time.perf_counter() - started)
+                # Announce the paper first so the upsert stage knows how many chunks to expect.
+                put(to_embed, ("file", filename, content_hash, ids))
+                for chunk_id, chunk in zip(ids, chunks):
+                    put(to_embed, ("chunk", filename, chunk_id, chunk.page_content, chunk.metadata))
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(to_embed, _DONE)
+
+    def embed_stage():
+        embeddings = vectorstore.embeddings
+        batch = []
+
+        def flush():
+            started = time.perf_counter()
+            vectors = embeddings.embed_documents([item[3] for item in batch])
+            stats["embed"].add(len(batch), time.perf_counter() - started)
+            put(to_upsert, ("batch", list(batch), vectors))
+            batch.clear()
+
+        try:
+            while True:
+                item = get(to_embed)
+                if item is _DONE:
+                    break
+                if item[0] in ("file", "failed"):
+                    put(to_upsert, item)
+                    continue
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(to_upsert, _DONE)
+
+    threads = [
+        threading.Thread(target=load_stage, name="ingest-load", daemon=True),
+        threading.Thread(target=split_stage, name="ingest-split", daemon=True),
+        threading.Thread(target=embed_stage, name="ingest-embed", daemon=True),
+    ]
+    pipeline_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    # The upsert stage runs on the calling thread; it also tracks per-paper completion.
+    remaining = {}
+    try:
+        while True:
+            item = get(to_upsert)
+            if item is _DONE:
+                break
+            if item[0] == "failed":
+                _, filename, content_hash, error = item
+                if on_file_failed is not None:
+                    on_file_failed(filename, content_hash, error)
+                finished = []
+            elif item[0] == "file":
+                _, filename, content_hash, ids = item
+                remaining[filename] = [content_hash, ids, len(ids)]
+                finished = [filename] if not ids else []
+            else:
+                _, batch, vectors = item
+                started = time.perf_counter()
+                upsert_chunks(
+                    vectorstore,
+                    ids=[item[2] for item in batch],
+                    texts=[item[3] for item in batch],
+                    metadatas=[item[4] for item in batch],
+                    vectors=vectors,
+                )
+                stats["upsert"].add(len(batch), time.perf_counter() - started)
+                finished = []
+                for _, filename, _, _, _ in batch:
+                    remaining[filename][2] -= 1
+                    if remaining[filename][2] == 0:
+                        finished.append(filename)
+            for filename in finished:
+                content_hash, ids, _ = remaining.pop(filename)
+                if on_file_done is not None:
+                    on_file_done(filename, content_hash, ids)
+            if progress is not None:
+                progress(list(stats.values()), time.perf_counter() - pipeline_start)
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return stats
+
+def format_progress(stats: list, elapsed: float) -> str:
+    """
+    Renders one progress line with the item count and throughput of every stage.
+    """
+    parts = [f"{s.name}: {s.items} {s.unit} ({s.rate(elapsed):.1f}/s)"
+             + (f", {s.failed} failed" if s.failed else "") for s in stats]
+    return f"[{elapsed:7.1f}s] " + " | ".join(parts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or update the research paper index.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of PDF extraction processes (default: all cores).")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Number of chunks per embedding call.")
+    args = parser.parse_args(argv)
+
+    from retriever import update_index, wait_for_artifacts
+
+    last_report = [0.0]
+    final = {}
+
+    def report(stats, elapsed):
+        final["stats"], final["elapsed"] = stats, elapsed
+        if elapsed - last_report[0] >= 1.0:
+            last_report[0] = elapsed
+            print(format_progress(stats, elapsed), file=sys.stderr)
+
+    try:
+        changes = update_index(progress=report, workers=args.workers, batch_size=args.batch_size)
+    except ValueError as e:
+        print(f"Retriever error: {e}", file=sys.stderr)
+        return 1
+    if final:
+        print(format_progress(final["stats"], final["elapsed"]), file=sys.stderr)
+    print(f"Added: {len(changes['added'])}, updated: {len(changes['updated'])}, "
+          f"removed: {len(changes['removed'])}, failed: {len(changes['failed'])}")
+    for filename, error in changes["failed"].items():
+        print(f"  failed: {filename}: {error}", file=sys.stderr)
+    # Citation links are updated on a background thread; finish them before exiting.
+    wait_for_artifacts()
+    if ARTIFACT_LLM_SUMMARIES:
+        # Wait for the paper summaries update_index() queued, rather than leaving them to the next run.
+        from artifacts import summarize_pending
+        try:
+            summarized = summarize_pending()
+        except Exception as e:
+            print(f"Paper summaries failed: {e}", file=sys.stderr)
+        else:
+            print(f"Paper summaries written: {summarized}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+# llm_cache.py
+
+import os
+import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import ollama_client
+from config import LLM_CACHE_DIR, LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_MAX_BYTES
+
+def cache_key(model: str, messages: list, tools: list = None, options: dict = None) -> str:
+    """
+    Returns a stable hash of everything that determines a chat() response.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "tools": tools, "options": options},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier cache of chat() responses keyed by cache_key(): a bounded in-memory
+    LRU in front of a directory of JSON files whose total size is capped at
+    max_bytes (least recently used files are evicted first).
+    """
+    def __init__(self, directory: str = LLM_CACHE_DIR, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _remember(self, key: str, response: dict):
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """
+        Returns the cached response for key, or None.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return copy.deepcopy(self._memory[key])
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                response = json.load(f)
+            # Bump the mtime so disk eviction is least-recently-used rather than oldest-written.
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+
+        with self._lock:
+            self.counters["disk_hits"] += 1
+            self._remember(key, response)
+        return copy.deepcopy(response)
+
+    def put(self, key: str, response: dict):
+        """
+        Stores a response in both tiers.
+        """
+        response = copy.deepcopy(response)
+        data = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.counters["stores"] += 1
+            self._remember(key, response)
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan()[1]
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        """
+        Returns the (mtime, size, path) of every cached file and their total size.
+        """
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        # Evict down to 90% of the limit so we don't rescan on every store.
+        entries, total = self._scan()
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.counters["evictions"] += 1
+        self._disk_bytes = total
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters and the overall hit rate.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            entries, _ = self._scan()
+            for _, _, path in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._disk_bytes = 0
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> ResponseCache:
+    """
+    Returns the process-wide response cache.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+def chat(model: str, messages: list, tools: list = None, options: dict = None,
+         cache: bool = True, **kwargs) -> dict:
+    """
+    Drop-in replacement for ollama_client.chat() that serves repeated requests from
+    the response cache. Pass cache=False for calls that should not be cached, e.g.
+    sampling with a non-zero temperature.
+    """
+    if not cache:
+        return ollama_client.chat(model=model, messages=messages, tools=tools, options=options, **kwargs)
+
+    key = cache_key(model, messages, tools, options)
+    response = get_cache().get(key)
+    if response is not None:
+        return response
+    response = ollama_client.chat(model=model, messages=messages, tools=tools, options=options, **kwargs)
+    # Don't pin empty or failed generations.
+    if response.get("message", {}).get("content"):
+        get_cache().put(key, response)
+    return response
+
+def cache_stats() -> dict:
+    """
+    Returns the hit/miss counters of the process-wide response cache.
+    """
+    return get_cache().stats()
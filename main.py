@@ -1,11 +1,35 @@
 # main.py
 
+# Imported first: the startup report measures from here.
+import startup
+import sys
+import argparse
+
+import tracing
 from agent import Agent
-from config import OLLAMA_MODEL
+from config import OLLAMA_MODEL, METRICS_PORT
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conversational research assistant.")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="Print how long startup and background warm-up took, then exit.")
+    args = parser.parse_args(argv)
+    startup.timer.mark("imports done")
 
-def main():
+    if tracing.enabled() and METRICS_PORT:
+        tracing.start_metrics_server(METRICS_PORT)
+        print(f"Serving metrics at http://localhost:{METRICS_PORT}/metrics")
+    # Load the index and the model while the user types the first question.
+    warm_up = startup.WarmUp(startup.warm_up_steps(OLLAMA_MODEL)).start()
     agent = Agent(model_name=OLLAMA_MODEL)
+    startup.timer.mark("prompt ready")
+
+    if args.startup_report:
+        warm_up.wait()
+        print(startup.timer.report())
+        return 0
     agent.converse()
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
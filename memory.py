@@ -0,0 +1,153 @@
+# memory.py
+
+from config import OLLAMA_MODEL, CONTEXT_TOKEN_BUDGET, STALE_TOOL_RESULT_TOKENS, CONVERSATION_SUMMARY_TOKENS
+from tokens import count_tokens, count_message_tokens, truncate_to_tokens
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+def llm_summarizer(previous_summary: str, messages: list) -> str:
+    """
+    Folds older messages into the running summary with the model.
+    """
+    from llm_cache import chat
+
+    transcript = "\n".join(f"{message['role']}: {message.get('content') or ''}" for message in messages)
+    prompt = (
+        "Update the running summary of a conversation between a researcher and a research assistant. "
+        "Keep the questions asked, the key findings and any paper titles, in a few sentences.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+    )
+    response = chat(model=OLLAMA_MODEL, messages=[{"role": "user", "content": prompt}], priority="background")
+    return response.get("message", {}).get("content", "").strip()
+
+def extractive_summarizer(previous_summary: str, messages: list,
+                          max_tokens: int = CONVERSATION_SUMMARY_TOKENS) -> str:
+    """
+    Model-free fallback: keeps the user questions and the start of each answer,
+    the most recent ones first, up to max_tokens tokens.
+    """
+    lines = previous_summary.splitlines() if previous_summary else []
+    for message in messages:
+        if message["role"] == "user":
+            lines.append("Q: " + truncate_to_tokens(message.get("content") or "", 60))
+        elif message["role"] == "assistant" and message.get("content"):
+            lines.append("A: " + truncate_to_tokens(message["content"], 80))
+    kept, used = [], 0
+    for line in reversed(lines):
+        # One token for the line break.
+        used += count_tokens(line) + 1
+        if used > max_tokens:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+class ConversationMemory:
+    """
+    Keeps the agent's conversation within a token budget so that the prompt sent
+    with every chat() call, and with it per-turn latency, stays flat over long
+    sessions. compact() applies these steps, cheapest first:
+
+      1. Drop system messages (final-answer instructions) left over from earlier turns.
+      2. Shorten tool results from earlier turns to `stale_tool_tokens` tokens.
+      3. Roll the oldest turns into a running summary message of at most
+         `summary_tokens` tokens.
+      4. As a last resort, drop the earlier turns that are left, then shorten
+         the summary, then the current turn's largest tool results.
+
+    Step 1 always applies; the others only while the conversation is over budget.
+    Only the system instructions and the current turn's own messages other than
+    tool results can keep it over budget.
+    """
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, stale_tool_tokens: int = STALE_TOOL_RESULT_TOKENS,
+                 summarizer=llm_summarizer, summary_tokens: int = CONVERSATION_SUMMARY_TOKENS):
+        self.budget = budget
+        self.stale_tool_tokens = stale_tool_tokens
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+
+    def _summarize(self, previous_summary: str, messages: list) -> str:
+        try:
+            summary = self.summarizer(previous_summary, messages)
+        except Exception:
+            summary = ""
+        # Never let a failed or empty model summary lose the history outright.
+        if not summary:
+            return extractive_summarizer(previous_summary, messages, self.summary_tokens)
+        return truncate_to_tokens(summary, self.summary_tokens)
+
+    def compact(self, conversation: list) -> list:
+        """
+        Returns a copy of conversation that fits the budget; the original is not modified.
+        Expects conversation[0] to be the agent's system instructions.
+        """
+        if not conversation:
+            return []
+        head = [conversation[0]]
+        summary = ""
+        rest = conversation[1:]
+        if rest and rest[0]["role"] == "system" and (rest[0].get("content") or "").startswith(SUMMARY_PREFIX):
+            summary = rest[0]["content"][len(SUMMARY_PREFIX):]
+            rest = rest[1:]
+
+        # Split into turns, each starting at a user message; the last one is in progress.
+        turns = []
+        for message in rest:
+            if message["role"] == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        current = turns.pop() if turns else []
+
+        # 1. Instructions from earlier turns are never needed again.
+        turns = [[message for message in turn if message["role"] != "system"] for turn in turns]
+
+        def assemble():
+            messages = list(head)
+            if summary:
+                messages.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+            for turn in turns:
+                messages.extend(turn)
+            messages.extend(current)
+            return messages
+
+        # 2. Earlier tool results are the bulk of the prompt and rarely needed in full.
+        if count_message_tokens(assemble()) > self.budget:
+            turns = [[dict(message, content=truncate_to_tokens(message.get("content") or "", self.stale_tool_tokens))
+                      if message["role"] == "tool" else message for message in turn] for turn in turns]
+
+        # 3. Roll the oldest turns into the running summary.
+        if count_message_tokens(assemble()) > self.budget and turns:
+            rolled = []
+            # Leave room for the summary to grow by about one stale tool result.
+            while turns and count_message_tokens(assemble()) + self.stale_tool_tokens > self.budget:
+                rolled.extend(turns.pop(0))
+            summary = self._summarize(summary, rolled)
+
+        # 4. Still over budget: drop what is left of the earlier turns, shorten the current
+        #    turn's largest tool results to `stale_tool_tokens`, then shorten the summary
+        #    and finally cut the tool results further.
+        def overflow():
+            return count_message_tokens(assemble()) - self.budget
+
+        def shorten_tool_results(floor):
+            for i in sorted((i for i, message in enumerate(current) if message["role"] == "tool"),
+                            key=lambda i: count_tokens(current[i].get("content") or ""), reverse=True):
+                excess = overflow()
+                if excess <= 0:
+                    return
+                content = current[i].get("content") or ""
+                size = count_tokens(content)
+                # A few spare tokens cover the truncation marker.
+                keep = max(floor, size - excess - 8)
+                if keep < size:
+                    current[i] = dict(current[i], content=truncate_to_tokens(content, keep))
+
+        while turns and overflow() > 0:
+            turns.pop(0)
+        current = list(current)
+        shorten_tool_results(self.stale_tool_tokens)
+        excess = overflow()
+        if excess > 0 and summary:
+            keep = count_tokens(summary) - excess - 8
+            summary = truncate_to_tokens(summary, keep) if keep >= self.stale_tool_tokens // 4 else ""
+        shorten_tool_results(0)
+        return assemble()
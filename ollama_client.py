@@ -1,48 +1,401 @@
 # ollama_client.py
 
 import json
+import time
+import codecs
+import queue
+import threading
+import tempfile
 import subprocess
+import http.client
+from urllib.parse import urlsplit
 
-def chat(model: str, messages: list, tools: list = None) -> dict:
+import tracing
+from scheduler import get_scheduler, request_key
+
+from config import (
+    OLLAMA_MODEL,
+    OLLAMA_BACKEND,
+    OLLAMA_FALLBACK_TO_SUBPROCESS,
+    OLLAMA_HOST,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_POOL_SIZE,
+    OLLAMA_TIMEOUT,
+)
+
+class OllamaError(RuntimeError):
+    """
+    Raised when the Ollama server returns an error response.
     """
-    Calls the Ollama model (e.g., Qwen2.5) via the command line.
-    
-    Parameters:
-      - model: the model name (e.g., "qwen2.5")
-      - messages: a list of message dictionaries (each with a role and content)
-      - tools: (optional) a list of tool schema dictionaries
 
-    Returns:
-      A dictionary representing the response.
+class ConnectionPool:
+    """
+    A thread-safe pool of keep-alive HTTP connections to one host.
+    """
+    def __init__(self, host: str, size: int = OLLAMA_POOL_SIZE, timeout: float = OLLAMA_TIMEOUT):
+        if "://" not in host:
+            host = "http://" + host
+        parts = urlsplit(host)
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        """
+        Returns an idle connection, or a new one if none is available.
+        The second value tells whether the connection was reused.
+        """
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            if self.scheme == "https":
+                return http.client.HTTPSConnection(self.netloc, timeout=self.timeout), False
+            return http.client.HTTPConnection(self.netloc, timeout=self.timeout), False
+
+    def release(self, conn):
+        """
+        Returns a connection to the pool, closing it if the pool is full.
+        """
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+class SubprocessBackend:
+    """
+    Calls the model through the Ollama CLI, one `ollama run` process per call.
+    """
+    def chat(self, payload: dict) -> dict:
+        # keep_alive only applies to the server; the CLI process exits after each call.
+        payload = {key: value for key, value in payload.items() if key != "keep_alive"}
+        # Convert the payload to a JSON string.
+        input_str = json.dumps(payload)
+
+        try:
+            # Run the Ollama CLI command. Make sure “ollama” is in your PATH.
+            result = subprocess.run(
+                ["ollama", "run", payload["model"]],
+                input=input_str,
+                text=True,
+                capture_output=True,
+                check=True
+            )
+        except subprocess.CalledProcessError as e:
+            print("Error calling Ollama:", e.stderr)
+            raise
+
+        # Try parsing the output as JSON.
+        try:
+            response = json.loads(result.stdout)
+        except json.JSONDecodeError:
+            # Fallback: if output is plain text.
+            response = {"message": {"content": result.stdout}}
+        return response
+
+    def stream(self, payload: dict):
+        payload = {key: value for key, value in payload.items() if key != "keep_alive"}
+        # stderr goes to a file so a chatty CLI cannot block on a full pipe while we read stdout.
+        stderr_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            ["ollama", "run", payload["model"]],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+        )
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            process.stdin.write(json.dumps(payload).encode("utf-8"))
+            process.stdin.close()
+            # The CLI prints tokens as they are generated; pass along whatever has arrived.
+            for data in iter(lambda: process.stdout.read1(4096), b""):
+                text = decoder.decode(data)
+                if text:
+                    yield {"message": {"role": "assistant", "content": text}, "done": False}
+            if process.wait() != 0:
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode("utf-8", errors="replace")
+                print("Error calling Ollama:", stderr)
+                raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr)
+            yield {"message": {"role": "assistant", "content": decoder.decode(b"", final=True)},
+                   "done": True}
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            stderr_file.close()
+
+    def preload(self, model: str, keep_alive=None):
+        # The CLI loads the model on every call; there is nothing to warm up.
+        pass
+
+class HTTPBackend:
+    """
+    Calls the model through the Ollama HTTP API over pooled keep-alive connections.
+    """
+    def __init__(self, host: str = OLLAMA_HOST, pool_size: int = OLLAMA_POOL_SIZE,
+                 timeout: float = OLLAMA_TIMEOUT):
+        self.pool = ConnectionPool(host, size=pool_size, timeout=timeout)
+
+    def _open(self, path: str, payload: dict):
+        """
+        Sends a POST request and returns the connection and its response headers.
+        """
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        while True:
+            conn, reused = self.pool.acquire()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                return conn, conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # The server may close idle keep-alive connections; retry once on a fresh one.
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+    def _finish(self, conn, resp):
+        """
+        Returns a fully read connection to the pool unless the server is closing it.
+        """
+        if resp.will_close:
+            conn.close()
+        else:
+            self.pool.release(conn)
+
+    def _check(self, resp, data: bytes):
+        if resp.status != 200:
+            message = data.decode("utf-8", errors="replace")
+            print("Error calling Ollama:", message)
+            raise OllamaError(f"Ollama returned HTTP {resp.status}: {message}")
+
+    def _post(self, path: str, payload: dict) -> dict:
+        conn, resp = self._open(path, payload)
+        try:
+            data = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        self._finish(conn, resp)
+        self._check(resp, data)
+        return json.loads(data)
+
+    def chat(self, payload: dict) -> dict:
+        payload = dict(payload, stream=False)
+        response = self._post("/api/chat", payload)
+        # Native tool calls live on the message; expose them where the agent looks for them.
+        tool_calls = response.get("message", {}).get("tool_calls")
+        if tool_calls:
+            response["tool_calls"] = tool_calls
+        return response
+
+    def stream(self, payload: dict):
+        payload = dict(payload, stream=True)
+        conn, resp = self._open("/api/chat", payload)
+        finished = False
+        try:
+            if resp.status != 200:
+                data = resp.read()
+                finished = True
+                self._check(resp, data)
+            # The server sends one JSON object per line as tokens are generated.
+            for line in resp:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise OllamaError(chunk["error"])
+                tool_calls = chunk.get("message", {}).get("tool_calls")
+                if tool_calls:
+                    chunk["tool_calls"] = tool_calls
+                yield chunk
+            finished = True
+        finally:
+            # A partially read response cannot be reused; drop the connection.
+            if finished:
+                self._finish(conn, resp)
+            else:
+                conn.close()
+
+    def preload(self, model: str, keep_alive=None):
+        # A chat request without messages loads the model and returns immediately.
+        payload = {"model": model, "messages": [], "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        self._post("/api/chat", payload)
+
+# Backend name -> zero-argument factory. Other backends can be added with register_backend().
+_backend_factories = {
+    "http": HTTPBackend,
+    "subprocess": SubprocessBackend,
+}
+_backends = {}
+_backend_name = OLLAMA_BACKEND
+_backend_lock = threading.Lock()
+
+def register_backend(name: str, factory):
+    """
+    Registers a backend factory under the given name. A backend provides
+    chat(payload) -> dict, stream(payload) yielding response chunks, and
+    preload(model, keep_alive).
+    """
+    with _backend_lock:
+        _backend_factories[name] = factory
+        _backends.pop(name, None)
+
+def set_backend(name: str):
     """
+    Selects the backend used by chat() and preload().
+    """
+    global _backend_name
+    if name not in _backend_factories:
+        raise ValueError(f"Unknown Ollama backend: {name}")
+    _backend_name = name
+
+def get_backend(name: str = None):
+    """
+    Returns the (process-wide) instance of the named or currently selected backend.
+    """
+    name = name or _backend_name
+    with _backend_lock:
+        if name not in _backends:
+            _backends[name] = _backend_factories[name]()
+        return _backends[name]
+
+def _call(method: str, *args):
+    """
+    Invokes a backend method, falling back to the subprocess backend when the
+    HTTP server cannot be reached and OLLAMA_FALLBACK_TO_SUBPROCESS is set.
+    """
+    try:
+        return getattr(get_backend(), method)(*args)
+    except ConnectionRefusedError:
+        if not (OLLAMA_FALLBACK_TO_SUBPROCESS and _backend_name == "http"):
+            raise
+        print("Ollama server unreachable at", OLLAMA_HOST, "- falling back to the Ollama CLI.")
+        set_backend("subprocess")
+        return getattr(get_backend(), method)(*args)
+
+def _call_stream(payload: dict):
+    """
+    Streams from the selected backend with the same fallback as _call().
+    """
+    chunks = get_backend().stream(payload)
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return
+    except ConnectionRefusedError:
+        if not (OLLAMA_FALLBACK_TO_SUBPROCESS and _backend_name == "http"):
+            raise
+        print("Ollama server unreachable at", OLLAMA_HOST, "- falling back to the Ollama CLI.")
+        set_backend("subprocess")
+        yield from get_backend().stream(payload)
+        return
+    yield first
+    yield from chunks
+
+def _payload(model, messages, tools, options, keep_alive) -> dict:
     payload = {
         "model": model,
         "messages": messages,
     }
     if tools is not None:
         payload["tools"] = tools
+    if options is not None:
+        payload["options"] = options
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    return payload
 
-    # Convert the payload to a JSON string.
-    input_str = json.dumps(payload)
+def _record_usage(span, payload: dict, content: str, response: dict):
+    """
+    Adds prompt/completion token counts to a chat span, preferring the counts
+    Ollama reports and estimating them otherwise.
+    """
+    from tokens import count_tokens, count_message_tokens
 
-    try:
-        # Run the Ollama CLI command. Make sure “ollama” is in your PATH.
-        result = subprocess.run(
-            ["ollama", "run", model],
-            input=input_str,
-            text=True,
-            capture_output=True,
-            check=True
-        )
-    except subprocess.CalledProcessError as e:
-        print("Error calling Ollama:", e.stderr)
-        raise
+    prompt_tokens = response.get("prompt_eval_count")
+    if prompt_tokens is None:
+        prompt_tokens = count_message_tokens(payload["messages"])
+    completion_tokens = response.get("eval_count")
+    if completion_tokens is None:
+        completion_tokens = count_tokens(content)
+    span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    tracing.count("agent_llm_prompt_tokens_total", prompt_tokens, model=payload["model"])
+    tracing.count("agent_llm_completion_tokens_total", completion_tokens, model=payload["model"])
 
-    # Try parsing the output as JSON.
-    try:
-        response = json.loads(result.stdout)
-    except json.JSONDecodeError:
-        # Fallback: if output is plain text.
-        response = {"message": {"content": result.stdout}}
-    
+def chat(model: str, messages: list, tools: list = None, options: dict = None,
+         keep_alive=OLLAMA_KEEP_ALIVE, priority: str = "normal") -> dict:
+    """
+    Calls the Ollama model (e.g., llama3.1:8b) through the selected backend.
+
+    Parameters:
+      - model: the model name (e.g., "llama3.1:8b")
+      - messages: a list of message dictionaries (each with a role and content)
+      - tools: (optional) a list of tool schema dictionaries
+      - options: (optional) model options such as temperature or num_ctx
+      - keep_alive: how long the server keeps the model loaded after this call
+      - priority: scheduling class, "interactive", "normal" or "background" (see scheduler.py)
+
+    Identical requests already in flight are not sent again; the caller gets a
+    copy of the in-flight request's response.
+
+    Returns:
+      A dictionary representing the response.
+    """
+    payload = _payload(model, messages, tools, options, keep_alive)
+    if not tracing.enabled():
+        return get_scheduler().run(lambda: _call("chat", payload), priority, request_key(payload))
+    with tracing.span("llm.chat", model=model, backend=_backend_name, messages=len(messages),
+                      tools=bool(tools)) as span:
+        response = get_scheduler().run(lambda: _call("chat", payload), priority, request_key(payload))
+        _record_usage(span, payload, response.get("message", {}).get("content") or "", response)
     return response
+
+def chat_stream(model: str, messages: list, tools: list = None, options: dict = None,
+                keep_alive=OLLAMA_KEEP_ALIVE, priority: str = "interactive"):
+    """
+    Streaming variant of chat(): yields response chunks as the model generates them.
+
+    Each chunk has the same shape as a chat() response, with the newly generated
+    tokens in chunk["message"]["content"]; the last chunk has "done" set to True.
+    The call holds a scheduler slot until the stream is exhausted or closed;
+    streams default to the "interactive" class, since someone is watching them.
+    """
+    payload = _payload(model, messages, tools, options, keep_alive)
+    if not tracing.enabled():
+        with get_scheduler().slot(priority):
+            yield from _call_stream(payload)
+        return
+    with tracing.span("llm.chat_stream", model=model, backend=_backend_name, messages=len(messages),
+                      tools=bool(tools)) as span, get_scheduler().slot(priority):
+        started = time.perf_counter()
+        parts, last = [], {}
+        for chunk in _call_stream(payload):
+            content = chunk.get("message", {}).get("content") or ""
+            if content and not parts:
+                span.set(time_to_first_token_ms=round((time.perf_counter() - started) * 1000, 3))
+            parts.append(content)
+            last = chunk
+            yield chunk
+        _record_usage(span, payload, "".join(parts), last)
+
+def preload(model: str = OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE):
+    """
+    Loads the model into memory ahead of the first chat() call and keeps it
+    resident for keep_alive.
+    """
+    _call("preload", model, keep_alive)
@@ -1,75 +1,629 @@
 # retriever.py
 
 import os
-from langchain.document_loaders import TextLoader
-from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-# from langchain.embeddings.openai import OpenAIEmbeddings
-# from langchain.vectorstores import Chroma
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
+# LangChain, its loaders and Chroma take most of a second to import, so they are
+# imported where they are first used rather than here, keeping startup fast.
 
 
-from config import RESEARCH_PAPERS_DIR
+from config import (
+    RESEARCH_PAPERS_DIR,
+    INDEX_DIR,
+    INDEX_REFRESH_SECONDS,
+    VECTOR_STORE,
+    RETRIEVER_K,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_THRESHOLD,
+)
+from embeddings import get_embeddings
+from context_packing import pack_context
+import artifacts
+import tracing
 
-def load_documents():
+COLLECTION_NAME = "research_assistant"
+MANIFEST_PATH = os.path.join(INDEX_DIR, "manifest.json")
+CHROMA_DIR = os.path.join(INDEX_DIR, "chroma")
+NUMPY_DIR = os.path.join(INDEX_DIR, "numpy")
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+
+# Bump whenever chunking changes so that existing indexes get rebuilt.
+# 2: chunks record their "start_index" in the source page.
+INDEX_VERSION = 2
+
+# Process-wide handles, created once by get_retriever().
+_lock = threading.RLock()
+_vectorstore = None
+_retriever = None
+_last_refresh = 0.0
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+# Hashes of papers whose artifacts were stored since the background artifact update last ran.
+_artifacts_lock = threading.Lock()
+_artifacts_added = set()
+_artifacts_due = False
+_artifacts_thread = None
+
+def import_dependencies():
     """
-    Loads research papers from the specified directory.
-    Supports .txt and .pdf files.
+    Imports the LangChain loaders and text splitter, and Chroma when it backs the
+    index, ahead of their first use (see startup.py).
+    """
+    from langchain_community.document_loaders import TextLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    if VECTOR_STORE != "numpy":
+        from langchain_community.vectorstores import Chroma
+
+def load_file(filepath: str) -> list:
+    """
+    Loads a single research paper. Supports .txt and .pdf files.
+    """
+    if filepath.endswith(".txt"):
+        from langchain_community.document_loaders import TextLoader
+        loader = TextLoader(filepath)
+    elif filepath.endswith(".pdf"):
+        try:
+            from langchain_community.document_loaders import PyPDFLoader
+        except ImportError:
+            raise ImportError("Please install PyPDF2 and langchain with PDF support.")
+        loader = PyPDFLoader(filepath)
+    else:
+        raise ValueError(f"Unsupported file format: {filepath}")
+    return loader.load()
+
+def list_papers() -> list:
+    """
+    Returns the sorted filenames of all supported papers in the research directory.
     """
-    documents = []
     if not os.path.exists(RESEARCH_PAPERS_DIR):
         raise ValueError(f"Directory {RESEARCH_PAPERS_DIR} does not exist.")
 
-    for filename in os.listdir(RESEARCH_PAPERS_DIR):
-        filepath = os.path.join(RESEARCH_PAPERS_DIR, filename)
-        if filename.endswith(".txt"):
-            loader = TextLoader(filepath)
-            docs = loader.load()
-            documents.extend(docs)
-        elif filename.endswith(".pdf"):
-            try:
-                from langchain_community.document_loaders import PyPDFLoader
-            except ImportError:
-                raise ImportError("Please install PyPDF2 and langchain with PDF support.")
-            loader = PyPDFLoader(filepath)
-            docs = loader.load()
-            documents.extend(docs)
+    filenames = []
+    for filename in sorted(os.listdir(RESEARCH_PAPERS_DIR)):
+        if filename.endswith(SUPPORTED_EXTENSIONS):
+            filenames.append(filename)
         else:
             print(f"Unsupported file format: {filename}. Skipping.")
-    
+    return filenames
+
+def load_documents():
+    """
+    Loads research papers from the specified directory.
+    Supports .txt and .pdf files.
+    """
+    documents = []
+    for filename in list_papers():
+        documents.extend(load_file(os.path.join(RESEARCH_PAPERS_DIR, filename)))
+
     if not documents:
         raise ValueError("No research papers loaded for retrieval.")
     return documents
 
+def split_documents(documents: list) -> list:
+    """
+    Splits loaded documents into chunks for embedding.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    # Use a larger chunk size for research papers. The start index lets
+    # context_packing merge overlapping chunks back together.
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100, add_start_index=True)
+    return splitter.split_documents(documents)
+
+def file_hash(filepath: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_ids(filename: str, content_hash: str, count: int) -> list:
+    """
+    Returns stable vector-store ids for the chunks of one version of a paper.
+    """
+    prefix = f"{filename}:{content_hash[:16]}"
+    return [f"{prefix}:{i}" for i in range(count)]
+
+def load_manifest() -> dict:
+    """
+    Loads the index manifest, which records for every indexed paper its
+    content hash, mtime, size and the ids of its chunks in the vector store,
+    plus the index version and embedding backend the index was built with.
+    """
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+    manifest.setdefault("version", INDEX_VERSION)
+    manifest.setdefault("embedding", None)
+    manifest.setdefault("files", {})
+    return manifest
+
+def save_manifest(manifest: dict):
+    """
+    Atomically writes the index manifest to disk.
+    """
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def open_vectorstore():
+    """
+    Opens (or creates) the persistent vector store backing the index: a Chroma
+    collection, or the in-process NumpyVectorStore when VECTOR_STORE is "numpy".
+    """
+    if VECTOR_STORE == "numpy":
+        from vector_store import NumpyVectorStore
+        return NumpyVectorStore(NUMPY_DIR, get_embeddings())
+    from langchain_community.vectorstores import Chroma
+
+    os.makedirs(CHROMA_DIR, exist_ok=True)
+    return Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=get_embeddings(),
+        persist_directory=CHROMA_DIR,
+    )
+
+def reset_vectorstore(vectorstore):
+    """
+    Drops every chunk of the vector store along with the collection or files
+    holding them, and returns a new, empty store. A store keeps the vector
+    dimension it was created with, so this is needed before re-indexing with
+    a different embedding backend.
+    """
+    if hasattr(vectorstore, "delete_collection"):
+        vectorstore.delete_collection()
+    else:
+        vectorstore.close()
+        shutil.rmtree(NUMPY_DIR, ignore_errors=True)
+    return open_vectorstore()
+
+def upsert_chunks(vectorstore, ids: list, texts: list, metadatas: list, vectors: list):
+    """
+    Writes pre-embedded chunks into the vector store, replacing any with the same ids.
+    """
+    if hasattr(vectorstore, "upsert"):
+        vectorstore.upsert(ids, texts, metadatas, vectors)
+        return
+    vectorstore._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+
+def update_index(vectorstore=None, progress=None, workers: int = None, batch_size: int = None) -> dict:
+    """
+    Brings the persistent index in line with the research directory.
+
+    Only papers that were added or whose contents changed are re-chunked and
+    re-embedded (through the streaming pipeline in ingest.py); chunks belonging
+    to deleted or changed papers are removed. Unchanged papers are detected by
+    mtime and size without re-reading them. A paper that cannot be loaded is
+    skipped and recorded with its error, so it is not retried until it changes.
+
+    If the index was built with another chunking version or embedding backend,
+    the vector store is recreated and every paper re-indexed.
+
+    Returns a dictionary listing the "added", "updated" and "removed" filenames,
+    and mapping "failed" filenames to their errors.
+    """
+    from ingest import run_pipeline
+
+    global _vectorstore, _retriever
+    with _lock:
+        if vectorstore is None:
+            vectorstore = _vectorstore or open_vectorstore()
+        manifest = load_manifest()
+        changes = {"added": [], "updated": [], "removed": [], "failed": {}}
+        embedding_name = vectorstore.embeddings.name
+
+        if manifest["version"] != INDEX_VERSION or manifest["embedding"] != embedding_name:
+            # Chunking or the embedding backend changed since the index was built. The new
+            # vectors may have another dimension, so recreate the store rather than emptying it.
+            shared = vectorstore is _vectorstore
+            vectorstore = reset_vectorstore(vectorstore)
+            if shared:
+                _vectorstore = vectorstore
+                _retriever = vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
+            manifest = {"version": INDEX_VERSION, "embedding": embedding_name, "files": {}}
+            save_manifest(manifest)
+
+        filenames = list_papers()
+        for filename in set(manifest["files"]) - set(filenames):
+            entry = manifest["files"].pop(filename)
+            if entry["chunk_ids"]:
+                vectorstore.delete(ids=entry["chunk_ids"])
+            changes["removed"].append(filename)
+            save_manifest(manifest)
+
+        jobs = []
+        stats = {}
+        for filename in filenames:
+            filepath = os.path.join(RESEARCH_PAPERS_DIR, filename)
+            stat = os.stat(filepath)
+            entry = manifest["files"].get(filename)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                continue
+
+            content_hash = file_hash(filepath)
+            if entry and entry["hash"] == content_hash:
+                # Touched but not modified: just record the new mtime.
+                entry["mtime"] = stat.st_mtime
+                save_manifest(manifest)
+                continue
+
+            if entry and entry["chunk_ids"]:
+                vectorstore.delete(ids=entry["chunk_ids"])
+                entry["chunk_ids"] = []
+                save_manifest(manifest)
+            jobs.append((filename, filepath, content_hash))
+            stats[filename] = stat
+            changes["updated" if entry else "added"].append(filename)
+
+        def on_file_done(filename, content_hash, ids):
+            manifest["files"][filename] = {
+                "hash": content_hash,
+                "mtime": stats[filename].st_mtime,
+                "size": stats[filename].st_size,
+                "chunk_ids": ids,
+            }
+            # Save after every paper so an interrupted run resumes where it stopped.
+            save_manifest(manifest)
+
+        def on_file_failed(filename, content_hash, error):
+            manifest["files"][filename] = {
+                "hash": content_hash,
+                "mtime": stats[filename].st_mtime,
+                "size": stats[filename].st_size,
+                "chunk_ids": [],
+                "error": str(error),
+            }
+            save_manifest(manifest)
+            for kind in ("added", "updated"):
+                if filename in changes[kind]:
+                    changes[kind].remove(filename)
+            changes["failed"][filename] = str(error)
+
+        store = artifacts.get_store()
+        extracted = set()
+
+        def on_document(filename, content_hash, text):
+            store.put(content_hash, artifacts.extract_artifacts(filename, text))
+            extracted.add(content_hash)
+
+        if jobs:
+            run_pipeline(jobs, vectorstore, on_file_done=on_file_done, progress=progress,
+                         workers=workers, batch_size=batch_size, on_document=on_document,
+                         on_file_failed=on_file_failed)
+        indexed = {entry["hash"] for entry in manifest["files"].values() if "error" not in entry}
+        if jobs or changes["removed"] or not indexed <= store.current_hashes():
+            start_artifact_update(extracted)
+
+        if not any(entry["chunk_ids"] for entry in manifest["files"].values()):
+            raise ValueError("No research papers loaded for retrieval.")
+        return changes
+
+def update_artifacts(manifest: dict, store, added: set = frozenset(), workers: int = None):
+    """
+    Brings the artifact store (see artifacts.py) in line with the manifest:
+    extracts artifacts for indexed papers that have none yet (e.g. indexed by an
+    older version) in the ingest process pool, drops those of removed papers,
+    updates the citation graph for these and the papers in added (whose
+    artifacts were stored during indexing), and queues model summaries.
+    """
+    from ingest import extract_paper_artifacts
+
+    added = set(added)
+    current = store.current_hashes()
+    jobs = [(filename, os.path.join(RESEARCH_PAPERS_DIR, filename), entry["hash"])
+            for filename, entry in manifest["files"].items()
+            if entry["hash"] not in current and "error" not in entry]
+
+    def on_artifact(filename, content_hash, artifact):
+        store.put(content_hash, artifact)
+        added.add(content_hash)
+
+    if jobs:
+        extract_paper_artifacts(jobs, on_artifact, workers=workers)
+    removed = store.retain({entry["hash"] for entry in manifest["files"].values()})
+    if added or removed:
+        store.update_citations(added, removed)
+        artifacts.start_background_summaries(store)
+
+def _update_artifacts():
+    global _artifacts_due, _artifacts_thread
+    while True:
+        with _artifacts_lock:
+            if not _artifacts_due:
+                _artifacts_thread = None
+                return
+            added = set(_artifacts_added)
+            _artifacts_added.clear()
+            _artifacts_due = False
+        try:
+            update_artifacts(load_manifest(), artifacts.get_store(), added)
+        except Exception as e:
+            print(f"Artifact update failed: {e}", file=sys.stderr)
+
+def start_artifact_update(added: set = frozenset()):
+    """
+    Runs update_artifacts() on a daemon thread, so that neither the index lock
+    nor a query waits for citation matching or artifact extraction. Requests
+    made while an update runs are merged into one more run afterwards.
+    """
+    global _artifacts_due, _artifacts_thread
+    with _artifacts_lock:
+        _artifacts_added.update(added)
+        _artifacts_due = True
+        if _artifacts_thread is None:
+            _artifacts_thread = threading.Thread(target=_update_artifacts, name="artifact-update", daemon=True)
+            _artifacts_thread.start()
+
+def wait_for_artifacts(timeout: float = None):
+    """
+    Waits for a running background artifact update to finish.
+    """
+    thread = _artifacts_thread
+    if thread is not None:
+        thread.join(timeout)
+
+def _refresh_index():
+    try:
+        update_index(_vectorstore)
+    except Exception as e:
+        # Keep serving the current index; the next refresh tries again.
+        print(f"Index refresh failed: {e}", file=sys.stderr)
+
+def _start_refresh():
+    """
+    Re-syncs the index with the research directory on a background thread,
+    unless a refresh is already running.
+    """
+    global _refresh_thread, _last_refresh
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _last_refresh = time.monotonic()
+        _refresh_thread = threading.Thread(target=_refresh_index, name="index-refresh", daemon=True)
+        _refresh_thread.start()
+
+def get_retriever():
+    """
+    Returns the process-wide retriever, opening the persistent index on first
+    use and re-syncing it with the research directory every INDEX_REFRESH_SECONDS.
+    Only the first call waits for the index; later re-syncs run in the
+    background while queries keep searching the current store.
+    """
+    global _vectorstore, _retriever, _last_refresh
+    if _retriever is None:
+        with _lock:
+            if _retriever is None:
+                _vectorstore = open_vectorstore()
+                update_index(_vectorstore)
+                _retriever = _vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
+                _last_refresh = time.monotonic()
+            return _retriever
+    if INDEX_REFRESH_SECONDS is not None and time.monotonic() - _last_refresh >= INDEX_REFRESH_SECONDS:
+        _start_refresh()
+    return _retriever
+
 def initialize_retriever():
     """
     Loads and indexes research papers from the designated directory.
+    Only new or changed papers are embedded; see update_index().
     """
-    documents = load_documents()
-    
-    # Use a larger chunk size for research papers.
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-    doc_chunks = splitter.split_documents(documents)
-    
-    embeddings = OpenAIEmbeddings()
-    vectorstore = Chroma.from_documents(doc_chunks, embedding=embeddings, collection_name="research_assistant")
-    retriever = vectorstore.as_retriever()
-    return retriever
+    global _last_refresh
+    with _lock:
+        if _retriever is not None:
+            update_index(_vectorstore)
+            _last_refresh = time.monotonic()
+        return get_retriever()
+
+def search_chunks(vectorstore, query_vector, k: int = RETRIEVER_K) -> list:
+    """
+    Returns the (id, text, metadata) of the k chunks most similar to query_vector, best first.
+    """
+    if hasattr(vectorstore, "_collection"):
+        # Chroma: query the collection directly, since LangChain's wrapper drops the ids.
+        result = vectorstore._collection.query(query_embeddings=[list(map(float, query_vector))], n_results=k,
+                                               include=["documents", "metadatas"])
+        return list(zip(result["ids"][0], result["documents"][0], result["metadatas"][0]))
+    return [(chunk_id, text, metadata) for chunk_id, text, metadata, _ in vectorstore.search(query_vector, k)]
+
+def get_chunks(vectorstore, ids: list) -> list:
+    """
+    Returns (id, text, metadata) for the chunk ids that still exist, in the given order.
+    """
+    if not ids:
+        return []
+    result = vectorstore.get(ids=ids)
+    if isinstance(result, dict):
+        # Chroma returns parallel lists in no particular order.
+        found = {chunk_id: (chunk_id, text, metadata)
+                 for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+    return result
+
+def _manifest_signature():
+    try:
+        stat = os.stat(MANIFEST_PATH)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class SemanticQueryCache:
+    """
+    Remembers the top-k chunk ids of recent queries. A query is answered from the
+    cache when its normalized text was seen before (without embedding it) or when
+    its embedding is within `threshold` cosine similarity of a cached query's.
+
+    Entries are tied to the index manifest: any change to it (papers added,
+    updated or removed) clears the cache. At most max_entries queries are kept,
+    least recently used first out.
+    """
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, threshold: float = QUERY_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # normalized query -> (matrix row, k, chunk ids), in LRU order.
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._row_keys = [None] * max_entries
+        self._signature = None
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _validate(self, signature):
+        if signature != self._signature:
+            if self._entries:
+                self.counters["invalidations"] += 1
+            self._entries.clear()
+            self._used[:] = False
+            self._row_keys = [None] * self.max_entries
+            self._signature = signature
+
+    def get_exact(self, query: str, k: int, signature) -> list:
+        """
+        Returns the cached chunk ids for this exact (normalized) query, or None.
+        """
+        key = self.normalize_query(query)
+        with self._lock:
+            self._validate(signature)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != k:
+                return None
+            self._entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return list(entry[2])
+
+    def get_similar(self, query_vector, k: int, signature) -> list:
+        """
+        Returns the chunk ids of the most similar cached query if it clears the
+        threshold, or None (counted as a miss).
+        """
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            self._validate(signature)
+            if self._entries and self._matrix is not None and self._matrix.shape[1] == vector.shape[0]:
+                scores = self._matrix @ vector
+                scores[~self._used] = -np.inf
+                row = int(np.argmax(scores))
+                key = self._row_keys[row]
+                entry = self._entries.get(key)
+                if scores[row] >= self.threshold and entry is not None and entry[1] == k:
+                    self._entries.move_to_end(key)
+                    self.counters["semantic_hits"] += 1
+                    return list(entry[2])
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, query: str, query_vector, k: int, ids: list, signature):
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        key = self.normalize_query(query)
+        with self._lock:
+            self._validate(signature)
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._used[:] = False
+            if key in self._entries:
+                row = self._entries.pop(key)[0]
+            elif len(self._entries) >= self.max_entries:
+                _, (row, _, _) = self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+            else:
+                row = int(np.argmin(self._used))
+            self._matrix[row] = vector
+            self._used[row] = True
+            self._row_keys[row] = key
+            self._entries[key] = (row, k, list(ids))
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+            lookups = hits + self.counters["misses"]
+            return {**self.counters, "entries": len(self._entries), "hit_rate": hits / lookups if lookups else 0.0}
+
+_query_cache = SemanticQueryCache() if QUERY_CACHE_SIZE else None
+
+def query_cache_stats() -> dict:
+    """
+    Returns the hit/miss counters of the semantic query cache.
+    """
+    return _query_cache.stats() if _query_cache is not None else {}
+
+def _cached_search(vectorstore, query: str, k: int, span) -> list:
+    """
+    Returns the (id, text, metadata) chunks for query, through the semantic query cache.
+    """
+    if _query_cache is None:
+        span.set(query_cache="disabled")
+        return search_chunks(vectorstore, vectorstore.embeddings.embed_query(query), k)
+    signature = _manifest_signature()
+    ids = _query_cache.get_exact(query, k, signature)
+    source = "exact"
+    vector = None
+    if ids is None:
+        vector = vectorstore.embeddings.embed_query(query)
+        ids = _query_cache.get_similar(vector, k, signature)
+        source = "semantic"
+    if ids is not None:
+        chunks = get_chunks(vectorstore, ids)
+        # A chunk can vanish if another process re-indexed; search again in that case.
+        if len(chunks) == len(ids):
+            span.set(query_cache=source)
+            tracing.count("agent_query_cache_lookups_total", result=source)
+            return chunks
+        if vector is None:
+            vector = vectorstore.embeddings.embed_query(query)
+    span.set(query_cache="miss")
+    tracing.count("agent_query_cache_lookups_total", result="miss")
+    chunks = search_chunks(vectorstore, vector, k)
+    _query_cache.put(query, vector, k, [chunk_id for chunk_id, _, _ in chunks], signature)
+    return chunks
 
 def retrieve_documents(query: str) -> str:
     """
     Retrieves and formats relevant research paper text for the given query.
+    Repeated and near-identical queries are served from the semantic query cache,
+    and the chunks are packed into RETRIEVAL_CONTEXT_TOKENS (see context_packing.py).
     """
-    try:
-        retriever = initialize_retriever()
-    except ValueError as e:
-        return f"Retriever error: {e}"
-    
-    results = retriever.get_relevant_documents(query)
-    
-    # Join all retrieved chunks.
-    result_text = "\n\n".join([doc.page_content for doc in results])
+    with tracing.span("retrieval", query_chars=len(query)) as span:
+        started = time.perf_counter()
+        try:
+            get_retriever()
+        except ValueError as e:
+            span.set(error=str(e))
+            return f"Retriever error: {e}"
+        # Time spent opening the index on first use, as opposed to searching it.
+        index_seconds = time.perf_counter() - started
+
+        results = _cached_search(_vectorstore, query, RETRIEVER_K, span)
+        search_seconds = time.perf_counter() - started - index_seconds
+        span.set(chunks=len(results), index_ms=round(index_seconds * 1000, 3),
+                 search_ms=round(search_seconds * 1000, 3))
+        tracing.observe("agent_retrieval_index_seconds", index_seconds)
+        tracing.observe("agent_retrieval_search_seconds", search_seconds)
+        tracing.count("agent_retrieval_chunks_total", len(results))
+
+        packing = {}
+        result_text = pack_context(results, stats=packing)
+        span.set(**{name: value for name, value in packing.items() if name != "chunks"})
+        tracing.count("agent_retrieval_context_tokens_total", packing["context_tokens"])
     return result_text
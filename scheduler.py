@@ -0,0 +1,169 @@
+# scheduler.py
+
+import copy
+import json
+import heapq
+import hashlib
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+import tracing
+from config import LLM_MAX_CONCURRENT
+
+# Priority classes, most urgent first: final answers a user is watching stream in,
+# the agent's own tool-selection round trips, and work such as summaries that
+# runs inside tools or in the background.
+PRIORITIES = {"interactive": 0, "normal": 1, "background": 2}
+
+def request_key(payload: dict) -> str:
+    """
+    Returns a hash of everything in a chat payload that determines the response,
+    used to recognize identical in-flight requests.
+    """
+    relevant = {name: payload.get(name) for name in ("model", "messages", "tools", "options", "format")}
+    data = json.dumps(relevant, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class LLMScheduler:
+    """
+    Admits at most `max_concurrent` model calls at a time, matching the number of
+    requests the model server processes in parallel, so that extra calls wait
+    here, in priority order, rather than in the server's FIFO queue.
+
+    run() also coalesces identical requests: while one is in flight, callers
+    with the same key wait for it and get a copy of its result instead of
+    computing it again.
+    """
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._inflight = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+        self.queue_time = {name: {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0} for name in PRIORITIES}
+
+    def _acquire(self, priority: str) -> float:
+        """
+        Blocks until a slot is free and no more urgent call is waiting; returns the seconds waited.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiting:
+                self._active += 1
+                waiter = None
+            else:
+                waiter = threading.Event()
+                heapq.heappush(self._waiting, (PRIORITIES[priority], next(self._sequence), waiter))
+        if waiter is not None:
+            # _release() hands its slot straight to the most urgent waiter.
+            waiter.wait()
+        waited = time.perf_counter() - started
+        with self._lock:
+            stats = self.queue_time[priority]
+            stats["count"] += 1
+            stats["total_seconds"] += waited
+            stats["max_seconds"] = max(stats["max_seconds"], waited)
+        tracing.observe("agent_llm_queue_seconds", waited, priority=priority)
+        tracing.current_span().set(priority=priority, queue_ms=round(waited * 1000, 3))
+        return waited
+
+    def _release(self):
+        with self._lock:
+            if self._waiting:
+                _, _, waiter = heapq.heappop(self._waiting)
+                waiter.set()
+            else:
+                self._active -= 1
+
+    @contextmanager
+    def slot(self, priority: str = "normal"):
+        """
+        Holds one model slot for the duration of the block, e.g. a streamed response.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def run(self, function, priority: str = "normal", key: str = None):
+        """
+        Calls function() while holding a slot. If key is given and a call with the
+        same key is already in flight, waits for that call and returns a copy of
+        its result instead.
+        """
+        if key is None:
+            with self.slot(priority):
+                return function()
+        with self._lock:
+            self.counters["calls"] += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            tracing.count("agent_llm_coalesced_total")
+            tracing.current_span().set(coalesced=True)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+        try:
+            with self.slot(priority):
+                flight.result = function()
+            return copy.deepcopy(flight.result)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = {name: 0 for name in PRIORITIES}
+            for rank, _, _ in self._waiting:
+                queued[next(name for name, value in PRIORITIES.items() if value == rank)] += 1
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self._active,
+                "queued": queued,
+                "in_flight": len(self._inflight),
+                **self.counters,
+                "queue_time": {
+                    name: {"count": stats["count"],
+                           "mean_ms": round(1000 * stats["total_seconds"] / max(stats["count"], 1), 3),
+                           "max_ms": round(1000 * stats["max_seconds"], 3)}
+                    for name, stats in self.queue_time.items()
+                },
+            }
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    """
+    Returns the process-wide scheduler used by ollama_client.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,416 @@
+# server.py
+#
+# Asyncio HTTP/JSON API around Agent, so one process can serve many users with a
+# single index and model client. Run from the repository root:
+#
+#   python server.py --host 127.0.0.1 --port 8000
+#
+# Endpoints:
+#   POST   /sessions               -> {"session_id": ...}
+#   DELETE /sessions/<id>
+#   POST   /sessions/<id>/query    {"query": ..., "stream": true}  -> NDJSON events (or JSON with stream=false)
+#   POST   /query                  one-off query without a session, same body and responses
+#   GET    /health                 sessions, active and queued turns
+#   GET    /metrics                Prometheus metrics (see tracing.py)
+
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import startup
+import tracing
+import retriever
+from agent import Agent
+from scheduler import get_scheduler
+from config import (
+    OLLAMA_MODEL,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_MAX_ACTIVE_TURNS,
+    SERVER_MAX_QUEUED_TURNS,
+    SERVER_QUEUE_TIMEOUT,
+    SERVER_MAX_SESSIONS,
+    SERVER_SESSION_TTL,
+)
+
+MAX_BODY_BYTES = 1024 * 1024
+# Seconds an idle keep-alive connection is held open.
+IDLE_TIMEOUT = 60
+# Events buffered per streaming turn before the agent thread waits for the client.
+STREAM_BUFFER = 64
+
+_REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+_DONE = object()
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+class Overloaded(HTTPError):
+    """
+    Raised when admission control turns a request away.
+    """
+    def __init__(self, message: str):
+        super().__init__(503, message, {"Retry-After": "5"})
+
+class Session:
+    """
+    One user's conversation. The lock serializes turns, since an Agent's
+    conversation is not safe to extend from two turns at once.
+    """
+    def __init__(self, model_name: str):
+        self.id = uuid.uuid4().hex
+        self.agent = Agent(model_name=model_name)
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.turns = 0
+
+class SessionStore:
+    """
+    Sessions by id, expiring after `ttl` idle seconds and evicted least recently
+    used first beyond `max_sessions`. Agents share the process-wide retriever and
+    Ollama client, so a session only holds its conversation.
+    """
+    def __init__(self, model_name: str = OLLAMA_MODEL, max_sessions: int = SERVER_MAX_SESSIONS,
+                 ttl: float = SERVER_SESSION_TTL):
+        self.model_name = model_name
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_used < self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            # Never drop a session in the middle of a turn.
+            if not session.lock.locked():
+                del self._sessions[session_id]
+
+    def create(self) -> Session:
+        session = Session(self.model_name)
+        self._sessions[session.id] = session
+        self._expire()
+        return session
+
+    def get(self, session_id: str) -> Session:
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, f"Unknown or expired session: {session_id}")
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str):
+        if self._sessions.pop(session_id, None) is None:
+            raise HTTPError(404, f"Unknown or expired session: {session_id}")
+
+class AdmissionController:
+    """
+    Bounds the number of agent turns running at once. Excess requests wait in a
+    bounded queue for up to `queue_timeout` seconds; beyond that, or when the
+    queue is full, they are rejected so that overload shows up as fast 503s
+    instead of ever-growing latency.
+    """
+    def __init__(self, max_active: int = SERVER_MAX_ACTIVE_TURNS, max_queued: int = SERVER_MAX_QUEUED_TURNS,
+                 queue_timeout: float = SERVER_QUEUE_TIMEOUT):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_active)
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if self._slots.locked() and self.queued >= self.max_queued:
+            self.rejected += 1
+            tracing.count("agent_server_rejected_total", reason="queue_full")
+            raise Overloaded("Server is at capacity; try again shortly.")
+        started = time.perf_counter()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            tracing.count("agent_server_rejected_total", reason="queue_timeout")
+            raise Overloaded("Timed out waiting for capacity; try again shortly.")
+        finally:
+            self.queued -= 1
+        self.active += 1
+        tracing.observe("agent_server_queue_seconds", time.perf_counter() - started)
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+class Request:
+    def __init__(self, method: str, path: str, headers: dict, body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self) -> dict:
+        try:
+            payload = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "Request body is not valid JSON.")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Request body must be a JSON object.")
+        return payload
+
+async def read_request(reader: asyncio.StreamReader) -> Request:
+    """
+    Reads one HTTP/1.1 request, or returns None when the client closed the connection.
+    """
+    try:
+        line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large.")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target.split("?", 1)[0], headers, body)
+
+def _head(status: int, headers: dict) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def send_body(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str,
+                    headers: dict = None, keep_alive: bool = True):
+    head = {"Content-Type": content_type, "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close"}
+    head.update(headers or {})
+    writer.write(_head(status, head) + body)
+    await writer.drain()
+
+async def send_json(writer: asyncio.StreamWriter, status: int, payload, headers: dict = None,
+                    keep_alive: bool = True):
+    await send_body(writer, status, json.dumps(payload).encode("utf-8"), "application/json",
+                    headers, keep_alive)
+
+class NDJSONStream:
+    """
+    A chunked application/x-ndjson response, one JSON object per line. Each write
+    waits for the socket to drain, so a slow client slows its own turn down
+    instead of growing server memory.
+    """
+    def __init__(self, writer: asyncio.StreamWriter, keep_alive: bool = True):
+        self.writer = writer
+        self.keep_alive = keep_alive
+        self.started = False
+
+    async def send(self, payload: dict):
+        if not self.started:
+            self.writer.write(_head(200, {"Content-Type": "application/x-ndjson", "Transfer-Encoding": "chunked",
+                                          "Connection": "keep-alive" if self.keep_alive else "close"}))
+            self.started = True
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+class AgentServer:
+    def __init__(self, model_name: str = OLLAMA_MODEL, max_active: int = SERVER_MAX_ACTIVE_TURNS,
+                 max_queued: int = SERVER_MAX_QUEUED_TURNS, queue_timeout: float = SERVER_QUEUE_TIMEOUT):
+        self.sessions = SessionStore(model_name)
+        self.admission = AdmissionController(max_active, max_queued, queue_timeout)
+        # Agents are synchronous; each admitted turn runs on one of these threads.
+        self.executor = ThreadPoolExecutor(max_workers=max_active, thread_name_prefix="agent-turn")
+        self.model_name = model_name
+
+    def warm_up(self):
+        """
+        Opens (and syncs) the shared index and loads the model before the first
+        request; the steps run concurrently (see startup.py).
+        """
+        startup.WarmUp(startup.warm_up_steps(self.model_name), verbose=True).start().wait()
+
+    async def run_turn(self, session: Session, query: str, emit):
+        """
+        Runs one agent turn on the executor and awaits emit(event) for each event.
+        If emit fails (the client went away), the turn is stopped at the next event.
+        The caller must hold an admission slot.
+        """
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue(maxsize=STREAM_BUFFER)
+        cancelled = threading.Event()
+
+        def produce():
+            stream = session.agent.stream(query)
+            try:
+                for event in stream:
+                    if cancelled.is_set():
+                        break
+                    if event["type"] == "final":
+                        answer = event["content"] or "I'm sorry, I didn't quite catch that. Could you please rephrase?"
+                        session.agent.conversation.append({"role": "assistant", "content": answer})
+                    # Blocks while the buffer is full, i.e. while the client is behind.
+                    asyncio.run_coroutine_threadsafe(events.put(event), loop).result()
+            except Exception as e:
+                if not cancelled.is_set():
+                    asyncio.run_coroutine_threadsafe(
+                        events.put({"type": "error", "message": str(e)}), loop).result()
+            finally:
+                stream.close()
+                if not cancelled.is_set():
+                    asyncio.run_coroutine_threadsafe(events.put(_DONE), loop).result()
+
+        future = loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                event = await events.get()
+                if event is _DONE:
+                    break
+                await emit(event)
+        finally:
+            cancelled.set()
+            # Unblock the producer if it is waiting on a full buffer, then let it finish.
+            while not future.done():
+                while not events.empty():
+                    events.get_nowait()
+                await asyncio.sleep(0.01)
+            await future
+        session.turns += 1
+
+    async def query(self, request: Request, writer: asyncio.StreamWriter, session: Session):
+        payload = request.json()
+        query = payload.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, 'Body must contain a non-empty "query" string.')
+        # Take the session first, so a user's queued follow-up does not hold a slot.
+        async with session.lock:
+            await self.admission.acquire()
+            try:
+                if payload.get("stream", True):
+                    stream = NDJSONStream(writer, request.keep_alive)
+                    await stream.send({"type": "session", "session_id": session.id})
+                    await self.run_turn(session, query, stream.send)
+                    await stream.close()
+                    return
+                result = {"session_id": session.id, "answer": "", "tools": []}
+
+                async def collect(event):
+                    if event["type"] == "tool_start":
+                        result["tools"].append(event["name"])
+                    elif event["type"] == "final":
+                        result["answer"] = event["content"]
+                    elif event["type"] == "error":
+                        raise HTTPError(500, event["message"])
+                await self.run_turn(session, query, collect)
+            finally:
+                self.admission.release()
+        await send_json(writer, 200, result, keep_alive=request.keep_alive)
+
+    async def dispatch(self, request: Request, writer: asyncio.StreamWriter):
+        parts = [part for part in request.path.split("/") if part]
+        route = (request.method, tuple(parts[:1] + ["<id>"] * (len(parts) > 1) + parts[2:]))
+        if route == ("GET", ("health",)):
+            await send_json(writer, 200, {"status": "ok", "sessions": len(self.sessions),
+                                          "active_turns": self.admission.active,
+                                          "queued_turns": self.admission.queued,
+                                          "rejected_turns": self.admission.rejected,
+                                          "llm_scheduler": get_scheduler().stats(),
+                                          "query_cache": retriever.query_cache_stats()},
+                            keep_alive=request.keep_alive)
+        elif route == ("GET", ("metrics",)):
+            await send_body(writer, 200, tracing.metrics_text().encode("utf-8"),
+                            "text/plain; version=0.0.4", keep_alive=request.keep_alive)
+        elif route == ("POST", ("sessions",)):
+            session = self.sessions.create()
+            await send_json(writer, 200, {"session_id": session.id}, keep_alive=request.keep_alive)
+        elif route == ("DELETE", ("sessions", "<id>")):
+            self.sessions.delete(parts[1])
+            await send_body(writer, 204, b"", "application/json", keep_alive=request.keep_alive)
+        elif route == ("POST", ("sessions", "<id>", "query")):
+            await self.query(request, writer, self.sessions.get(parts[1]))
+        elif route == ("POST", ("query",)):
+            # Sessionless queries get a throwaway agent that is never stored.
+            await self.query(request, writer, Session(self.model_name))
+        else:
+            raise HTTPError(404, f"No route for {request.method} {request.path}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    await self.dispatch(request, writer)
+                except HTTPError as e:
+                    await send_json(writer, e.status, {"error": str(e)}, e.headers, keep_alive=False)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                except Exception as e:
+                    await send_json(writer, 500, {"error": str(e)}, keep_alive=False)
+                    break
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = SERVER_HOST, port: int = SERVER_PORT):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.warm_up)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Research assistant API listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the research agent over HTTP.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-active", type=int, default=SERVER_MAX_ACTIVE_TURNS,
+                        help="Agent turns run at once.")
+    parser.add_argument("--max-queued", type=int, default=SERVER_MAX_QUEUED_TURNS,
+                        help="Turns allowed to wait for a slot before requests are rejected.")
+    args = parser.parse_args(argv)
+    server = AgentServer(max_active=args.max_active, max_queued=args.max_queued)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# startup.py
+#
+# Import this module first: its import time is the reference point of the startup report.
+
+import sys
+import time
+import threading
+
+_started = time.perf_counter()
+
+class StartupTimer:
+    """
+    Records when startup milestones are reached and when each warm-up phase ran,
+    in seconds since the process began importing its modules.
+    """
+    def __init__(self, started: float = None):
+        self.started = _started if started is None else started
+        self._lock = threading.Lock()
+        self.milestones = []
+        self.phases = []
+
+    def now(self) -> float:
+        return time.perf_counter() - self.started
+
+    def mark(self, name: str):
+        with self._lock:
+            self.milestones.append((name, self.now()))
+
+    def record(self, name: str, began: float, ended: float, error: Exception = None):
+        with self._lock:
+            self.phases.append((name, began, ended, error))
+
+    def report(self) -> str:
+        """
+        Renders the milestones and warm-up phases as a small table.
+        """
+        with self._lock:
+            milestones, phases = list(self.milestones), sorted(self.phases, key=lambda phase: phase[1])
+        lines = ["Startup report (seconds since start):"]
+        for name, at in milestones:
+            lines.append(f"  {name:<24}{at:>9.3f}")
+        for name, began, ended, error in phases:
+            line = f"  {name:<24}{began:>9.3f} -> {ended:.3f}  ({ended - began:.3f}s)"
+            lines.append(line + (f"  failed: {' '.join(str(error).split())}" if error is not None else ""))
+        ready = dict(milestones).get("prompt ready")
+        if ready is not None and phases:
+            finished = max(ended for _, _, ended, _ in phases)
+            lines.append(f"Background warm-up finished {max(0.0, finished - ready):.3f}s "
+                         f"after the prompt was ready.")
+        return "\n".join(lines)
+
+timer = StartupTimer()
+
+def warm_up_steps(model_name: str) -> list:
+    """
+    Returns the warm-up work for an agent process as lists of (name, function)
+    phases; each list runs on its own thread, its phases in order.
+    """
+    import tokens
+    import retriever
+    import ollama_client
+
+    return [
+        [("index imports", retriever.import_dependencies), ("index load", retriever.get_retriever)],
+        [("tokenizer", tokens.get_encoding)],
+        [("model preload", lambda: ollama_client.preload(model_name))],
+    ]
+
+class WarmUp:
+    """
+    Runs warm-up steps on daemon threads, so the index loads and the model is
+    preloaded while the user types the first question. A phase that fails is
+    recorded (and printed if verbose) and the rest of its step is skipped; the
+    first real request then reports the error.
+    """
+    def __init__(self, steps: list, startup_timer: StartupTimer = timer, verbose: bool = False):
+        self.steps = steps
+        self.timer = startup_timer
+        self.verbose = verbose
+        self.errors = {}
+        self._threads = []
+
+    def _run(self, phases: list):
+        for name, function in phases:
+            began = self.timer.now()
+            try:
+                function()
+            except Exception as e:
+                self.errors[name] = e
+                self.timer.record(name, began, self.timer.now(), e)
+                if self.verbose:
+                    print(f"Warm-up of the {name} failed: {e}", file=sys.stderr)
+                return
+            self.timer.record(name, began, self.timer.now())
+
+    def start(self):
+        for phases in self.steps:
+            thread = threading.Thread(target=self._run, args=(phases,), name=f"warm-up-{phases[0][0]}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Waits for every step to finish; returns False if timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
@@ -0,0 +1,102 @@
+# summarization.py
+
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_cache import chat
+from tokens import count_tokens, truncate_to_tokens
+from config import OLLAMA_MODEL, SUMMARY_SECTION_TOKENS, SUMMARY_MAX_WORKERS
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def _pieces(text: str, max_tokens: int) -> list:
+    """
+    Splits text into paragraphs, breaking paragraphs that are too long by sentence
+    and, failing that, by raw token count.
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_RE.split(paragraph):
+            while count_tokens(sentence) > max_tokens:
+                head = truncate_to_tokens(sentence, max_tokens, marker="")
+                pieces.append(head)
+                sentence = sentence[len(head):]
+            if sentence.strip():
+                pieces.append(sentence.strip())
+    return pieces
+
+def split_into_sections(text: str, max_tokens: int = SUMMARY_SECTION_TOKENS) -> list:
+    """
+    Splits text into sections of at most max_tokens tokens along paragraph boundaries.
+
+    Boundaries are content-defined: past half the budget, a section ends after any
+    paragraph whose hash hits a fixed pattern. A local edit therefore only changes
+    the sections around it, and the other sections (and their cached summaries)
+    stay the same.
+    """
+    sections, current, size = [], [], 0
+    for piece in _pieces(text, max_tokens):
+        piece_tokens = count_tokens(piece)
+        if current and size + piece_tokens > max_tokens:
+            sections.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += piece_tokens
+        if size >= max_tokens // 2 and zlib.crc32(piece.encode("utf-8")) % 4 == 0:
+            sections.append("\n\n".join(current))
+            current, size = [], 0
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+def complete(prompt: str) -> str:
+    """
+    Runs a single-prompt completion through the response cache.
+    """
+    response = chat(model=OLLAMA_MODEL, messages=[{"role": "user", "content": prompt}], priority="background")
+    return response.get("message", {}).get("content", "")
+
+def map_reduce(text: str, map_instruction: str, reduce_instruction: str,
+               section_tokens: int = SUMMARY_SECTION_TOKENS, max_workers: int = SUMMARY_MAX_WORKERS) -> str:
+    """
+    Hierarchical processing of text that may not fit the model's context:
+
+      - map: each section is sent with map_instruction, in parallel;
+      - reduce: partial results are grouped to fit section_tokens and combined
+        with reduce_instruction, recursively, until one result remains.
+
+    Every model call goes through llm_cache, whose key covers the section text, so
+    unchanged sections of a re-submitted paper are served from the cache.
+    """
+    sections = split_into_sections(text, section_tokens)
+    if not sections:
+        return ""
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="map-reduce") as executor:
+        partials = list(executor.map(lambda section: complete(f"{map_instruction}\n\n{section}"), sections))
+        while len(partials) > 1:
+            groups, current, size = [], [], 0
+            for partial in partials:
+                partial_tokens = count_tokens(partial)
+                # Always combine at least two partials so every round shrinks the list.
+                if len(current) >= 2 and size + partial_tokens > section_tokens:
+                    groups.append(current)
+                    current, size = [], 0
+                current.append(partial)
+                size += partial_tokens
+            groups.append(current)
+            partials = list(executor.map(
+                lambda group: complete(f"{reduce_instruction}\n\n" + "\n\n---\n\n".join(group)), groups))
+    return partials[0]
+
+def is_long(text: str, section_tokens: int = SUMMARY_SECTION_TOKENS) -> bool:
+    """
+    Returns True if text is too long to send in a single prompt.
+    """
+    return count_tokens(text) > section_tokens
@@ -0,0 +1,56 @@
+# tokens.py
+
+import threading
+from functools import lru_cache
+
+from config import TOKENIZER_ENCODING
+
+# Rough per-message overhead of chat formatting (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def get_encoding():
+    """
+    Returns the tiktoken encoding, or None if tiktoken (or its data) is unavailable.
+    """
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception:
+                _encoding = False
+        return _encoding or None
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """
+    Returns the number of tokens in text (about 4 characters per token without tiktoken).
+    """
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages: list) -> int:
+    """
+    Returns the approximate prompt size of a list of chat messages.
+    """
+    return sum(count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+               for message in messages)
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = " [...]") -> str:
+    """
+    Returns the first max_tokens tokens of text, followed by marker if anything was cut.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4] + marker
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + marker
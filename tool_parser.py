@@ -0,0 +1,321 @@
+# tool_parser.py
+
+import re
+import ast
+import json
+import bisect
+from collections import Counter
+
+# Keys whose values (an object, or the objects in an array) are tool calls.
+CALL_CONTAINER_KEYS = ("tool_calls", "tools")
+
+_STRUCTURAL = re.compile(r"[{}\[\]\"':,]")
+_STRING_END = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+_CLOSERS = {"{": "}", "[": "]"}
+
+def _loads(text: str):
+    """
+    Parses a JSON object, accepting Python-literal syntax (single quotes, True/None) as a fallback.
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+def is_tool_call(obj, top_level: bool = False) -> bool:
+    """
+    Returns True if obj has one of the tool-call shapes the model produces:
+    {"function_name": ...}, {"function": {"name": ...}}, {"function": "..."} or
+    {"name": ..., "parameters"/"arguments": ...}. A bare {"name": ...} only counts
+    inside a tool_calls/tools container, not as a top-level object.
+    """
+    if not isinstance(obj, dict):
+        return False
+    if "function_name" in obj:
+        return True
+    function = obj.get("function")
+    if isinstance(function, dict):
+        return "name" in function
+    if isinstance(function, str):
+        return True
+    if isinstance(obj.get("name"), str):
+        return not top_level or "parameters" in obj or "arguments" in obj
+    return False
+
+def calls_from_object(obj) -> list:
+    """
+    Extracts the tool calls from a parsed model output object.
+    """
+    if isinstance(obj, list):
+        return [call for item in obj for call in calls_from_object(item)]
+    if not isinstance(obj, dict):
+        return []
+    tool_calls = obj.get("tool_calls")
+    if isinstance(tool_calls, dict):
+        return [tool_calls]
+    if isinstance(tool_calls, list) and tool_calls:
+        return [call for call in tool_calls if isinstance(call, dict)]
+    tools = obj.get("tools")
+    if isinstance(tools, list) and tools:
+        return [tool for tool in tools if is_tool_call(tool)]
+    if is_tool_call(obj, top_level=True):
+        return [obj]
+    return []
+
+def normalize_tool_call(tool_call: dict):
+    """
+    Normalizes the different tool-call shapes the model produces to (name, arguments).
+    """
+    if "function_name" in tool_call:
+        tool_name = tool_call["function_name"]
+        tool_args = tool_call.get("arguments", {})
+    elif isinstance(tool_call.get("function"), dict):
+        tool_name = tool_call["function"].get("name")
+        tool_args = tool_call["function"].get("arguments", {})
+    elif "name" in tool_call:
+        tool_name = tool_call.get("name")
+        tool_args = tool_call.get("parameters", tool_call.get("arguments", {}))
+    else:
+        tool_name = tool_call.get("function")
+        tool_args = tool_call.get("arguments", {})
+    if isinstance(tool_args, str):
+        # Some servers send the arguments as a JSON-encoded string.
+        parsed = _loads(tool_args)
+        tool_args = parsed if isinstance(parsed, dict) else {}
+    if not isinstance(tool_args, dict):
+        tool_args = {}
+    return tool_name, dict(tool_args)
+
+class _Frame:
+    __slots__ = ("kind", "start", "key", "pending_key")
+
+    def __init__(self, kind: str, start: int, key: str):
+        self.kind = kind
+        self.start = start
+        self.key = key
+        self.pending_key = None
+
+class ToolCallParser:
+    """
+    Incremental parser for tool calls in streamed model output.
+
+    feed() takes the next piece of text and returns the tool calls whose JSON
+    objects were completed by it, so a call can be dispatched while the model is
+    still generating the rest. The scanner tracks string and bracket state across
+    pieces, skips any prose around the JSON, and considers an object a call when
+    it is a top-level object with a call shape or an entry of a tool_calls/tools
+    container (see is_tool_call). Each character is scanned once.
+
+    finish() ends the stream and applies the repair fallbacks: if the output was
+    cut off, the open brackets and strings are closed and any calls not yet
+    emitted are returned.
+    """
+    def __init__(self):
+        # The output so far, kept as the pieces fed, so each feed() costs only its own length.
+        self._pieces = []
+        self._offsets = []
+        self._length = 0
+        self.calls = []
+        self._stack = []
+        self._quote = None
+        self._escaped = False
+        self._string_start = 0
+        self._last_string = None
+        # End offset of the first complete top-level object.
+        self.first_object_end = None
+
+    @property
+    def buffer(self) -> str:
+        if len(self._pieces) > 1:
+            self._pieces = ["".join(self._pieces)]
+            self._offsets = [0]
+        return self._pieces[0] if self._pieces else ""
+
+    def _text(self, start: int, end: int) -> str:
+        """
+        Returns the output between two absolute offsets.
+        """
+        first = bisect.bisect_right(self._offsets, start) - 1
+        parts = []
+        for index in range(first, len(self._pieces)):
+            offset = self._offsets[index]
+            if offset >= end:
+                break
+            parts.append(self._pieces[index][max(0, start - offset):end - offset])
+        return "".join(parts)
+
+    def feed(self, text: str) -> list:
+        """
+        Consumes the next piece of output and returns the newly completed tool calls.
+        """
+        if not text:
+            return []
+        offset = self._length
+        self._pieces.append(text)
+        self._offsets.append(offset)
+        self._length += len(text)
+        found = []
+        stack = self._stack
+        pos, end = 0, len(text)
+        if self._escaped:
+            # The previous piece ended with a backslash inside a string.
+            self._escaped = False
+            pos = 1
+        while pos < end:
+            if self._quote is not None:
+                match = _STRING_END[self._quote].search(text, pos)
+                if match is None:
+                    break
+                i = match.start()
+                if text[i] == "\\":
+                    if i + 1 >= end:
+                        self._escaped = True
+                        break
+                    pos = i + 2
+                    continue
+                self._quote = None
+                self._last_string = (self._string_start, offset + i + 1)
+                pos = i + 1
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                break
+            i, char = match.start(), match.group()
+            pos = i + 1
+            if not stack:
+                # Outside any object: skip prose, including its quotes and brackets.
+                if char == "{":
+                    stack.append(_Frame("{", offset + i, None))
+                continue
+            top = stack[-1]
+            if char in "\"'":
+                self._quote = char
+                self._string_start = offset + i
+            elif char == ":":
+                if top.kind == "{" and self._last_string is not None:
+                    key = _loads(self._text(*self._last_string))
+                    top.pending_key = key if isinstance(key, str) else None
+            elif char == ",":
+                if top.kind == "{":
+                    top.pending_key = None
+            elif char in "{[":
+                key = top.pending_key if top.kind == "{" else top.key
+                stack.append(_Frame(char, offset + i, key))
+            else:
+                frame = stack.pop()
+                if not stack and self.first_object_end is None:
+                    self.first_object_end = offset + i + 1
+                if frame.kind == "{" and (not stack or frame.key in CALL_CONTAINER_KEYS):
+                    obj = _loads(self._text(frame.start, offset + i + 1))
+                    if is_tool_call(obj, top_level=not stack):
+                        found.append(obj)
+        self.calls.extend(found)
+        return found
+
+    def _repaired(self, start: int) -> str:
+        """
+        Returns the buffer from start with the open string and brackets closed,
+        completing a dangling key or dropping a trailing comma on the way.
+        """
+        text = self.buffer[start:]
+        top = self._stack[-1] if self._stack else None
+        expecting_key = top is not None and top.kind == "{" and top.pending_key is None
+        if self._quote is not None:
+            if self._escaped:
+                # Cut off right after a backslash.
+                text = text[:-1]
+            text += self._quote
+            if expecting_key:
+                text += ": null"
+        else:
+            text = text.rstrip()
+            if text.endswith(","):
+                text = text[:-1]
+            elif text.endswith(":"):
+                text += " null"
+            elif expecting_key and text.endswith(("\"", "'")):
+                text += ": null"
+        return text + "".join(_CLOSERS[frame.kind] for frame in reversed(self._stack))
+
+    def finish(self) -> list:
+        """
+        Ends the stream and returns the calls recovered by the repair fallbacks
+        that feed() has not already returned.
+        """
+        if self._stack:
+            repaired = _loads(self._repaired(self._stack[0].start))
+        elif not self.calls:
+            repaired = extract_json(self.buffer)
+        else:
+            return []
+        remaining = Counter(json.dumps(call, sort_keys=True, default=str) for call in self.calls)
+        found = []
+        for call in calls_from_object(repaired):
+            fingerprint = json.dumps(call, sort_keys=True, default=str)
+            if remaining[fingerprint]:
+                remaining[fingerprint] -= 1
+                continue
+            found.append(call)
+        self.calls.extend(found)
+        return found
+
+def extract_json(text: str) -> dict:
+    """
+    Attempt to extract a JSON object from the provided text.
+
+    1. Try json.loads directly.
+    2. Strip code fences and quotes, skip any prose before the first "{" and
+       ignore anything after the object.
+    3. If the object is cut off, close its open strings and brackets.
+    4. Accept Python-literal syntax (ast.literal_eval) at each step.
+
+    Returns an empty dict if all attempts fail.
+    """
+    text = text.strip()
+    try:
+        result = json.loads(text)
+        return result if isinstance(result, dict) else {}
+    except ValueError:
+        pass
+
+    text = re.sub(r"^```[a-zA-Z]*|```$", "", text.strip("\"")).strip().strip("`\"")
+    start = text.find("{")
+    if start < 0:
+        return {}
+    text = text[start:]
+    try:
+        result, _ = json.JSONDecoder().raw_decode(text)
+        if isinstance(result, dict):
+            return result
+    except ValueError:
+        pass
+
+    parser = ToolCallParser()
+    parser.feed(text)
+    if parser.first_object_end is not None:
+        candidate = text[:parser.first_object_end]
+    else:
+        candidate = parser._repaired(0)
+    result = _loads(candidate)
+    return result if isinstance(result, dict) else {}
+
+def parse_tool_calls(response: dict) -> list:
+    """
+    Extracts the list of tool calls from a complete chat() response, whether they
+    come back natively ("tool_calls"/"tools") or as JSON in the message content.
+    """
+    native = response.get("tool_calls")
+    if native:
+        return calls_from_object({"tool_calls": native})
+    if isinstance(response.get("tools"), list):
+        calls = calls_from_object({"tools": response["tools"]})
+        if calls:
+            return calls
+    parser = ToolCallParser()
+    content = response.get("message", {}).get("content", "") or ""
+    return parser.feed(content) + parser.finish()
@@ -1,7 +1,10 @@
 # tools.py
 
+from concurrent.futures import ThreadPoolExecutor
 from retriever import retrieve_documents
-from ollama_client import chat
+import artifacts
+from llm_cache import chat
+from summarization import map_reduce, is_long
 from config import OLLAMA_MODEL
 
 def get_search_results(query: str) -> str:
@@ -14,34 +17,68 @@ def get_search_results(query: str) -> str:
 def summarize_paper(text: str) -> str:
     """
     Summarizes the provided research paper text into a concise paragraph.
+    If the text names the file of a paper in the corpus, or contains its full
+    title, the summary precomputed at ingest time is returned (see
+    artifacts.resolve_paper).
+    Texts too long for one prompt are summarized section by section and the
+    partial summaries combined (see summarization.map_reduce).
     """
+    stored = artifacts.paper_summary(text)
+    if stored is not None:
+        return stored
+    if is_long(text):
+        return map_reduce(
+            text,
+            "Summarize the following section of a research paper in a concise paragraph:",
+            "Combine the following partial summaries of one research paper into a single concise paragraph:",
+        )
     prompt = f"Summarize the following research paper text in a concise paragraph:\n\n{text}"
     messages = [{"role": "user", "content": prompt}]
-    response = chat(model=OLLAMA_MODEL, messages=messages)
+    response = chat(model=OLLAMA_MODEL, messages=messages, priority="background")
     return response.get("message", {}).get("content", "")
 
 def compare_papers(text1: str, text2: str) -> str:
     """
     Compares two research paper excerpts, highlighting key similarities and differences.
+    Long excerpts are first condensed with summarize_paper.
     """
+    if is_long(text1) or is_long(text2):
+        # Condense both papers concurrently; short ones pass through unchanged.
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            text1, text2 = executor.map(lambda text: summarize_paper(text) if is_long(text) else text,
+                                        [text1, text2])
     prompt = (
         f"Compare the following two research paper excerpts. "
         f"Highlight the main similarities and differences.\n\n"
         f"Text 1:\n{text1}\n\nText 2:\n{text2}"
     )
     messages = [{"role": "user", "content": prompt}]
-    response = chat(model=OLLAMA_MODEL, messages=messages)
+    response = chat(model=OLLAMA_MODEL, messages=messages, priority="background")
     return response.get("message", {}).get("content", "")
 
 def analyze_citations(text: str) -> str:
     """
     Analyzes the citations in the provided research paper text,
     identifying key references and their significance.
+    Questions about a paper in the corpus, or about the corpus as a whole, are
+    answered from the reference lists and citation graph built at ingest time
+    (see artifacts.citation_report); other texts go to the model.
+    Long texts are analyzed section by section and the findings combined.
     """
+    report = artifacts.citation_report(text)
+    if report is not None:
+        return report
+    if is_long(text):
+        return map_reduce(
+            text,
+            "List the citations in the following section of a research paper and what each is used for:",
+            "Combine the following citation notes from one research paper. "
+            "Identify key references and explain their significance.",
+        )
     prompt = (
         f"Analyze the citations in the following research paper excerpt. "
         f"Identify key references and explain their significance.\n\n{text}"
     )
     messages = [{"role": "user", "content": prompt}]
-    response = chat(model=OLLAMA_MODEL, messages=messages)
+    response = chat(model=OLLAMA_MODEL, messages=messages, priority="background")
     return response.get("message", {}).get("content", "")
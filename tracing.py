@@ -0,0 +1,229 @@
+# tracing.py
+
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import TRACING_ENABLED, TRACE_FILE, METRICS_PORT
+
+# Histogram bucket upper bounds, in seconds.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_enabled = TRACING_ENABLED
+_trace_file = TRACE_FILE
+_current = contextvars.ContextVar("current_span", default=None)
+
+class _NoopSpan:
+    """
+    Returned by span() while tracing is disabled, so instrumentation costs one
+    function call and a flag check.
+    """
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """
+    A timed operation with attributes. Spans started while another span is
+    active (in the same context) become its children.
+    """
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id", "start", "_started", "_token")
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        parent = _current.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Generators can be resumed from another context; just drop back to the parent.
+            _current.set(None)
+        if exc_type is GeneratorExit:
+            # A consumer stopped iterating a traced generator early.
+            self.attributes["cancelled"] = True
+            exc = None
+        _record(self, duration, exc)
+        return False
+
+class _Metrics:
+    """
+    Thread-safe counters and duration histograms, rendered in the Prometheus text format.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float, labels: dict):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, labels: dict):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(DURATION_BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def render(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"'.replace("\n", " ") for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self.histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            cumulative = 0
+            for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{fmt(labels)} {total}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = _Metrics()
+_file_lock = threading.Lock()
+
+def _record(span: Span, duration: float, exc):
+    labels = {"span": span.name}
+    metrics.observe("agent_span_duration_seconds", duration, labels)
+    if exc is not None:
+        metrics.inc("agent_span_errors_total", 1, labels)
+    if not _trace_file:
+        return
+    record = {
+        "name": span.name,
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "start": span.start,
+        "duration_ms": round(duration * 1000, 3),
+        "attributes": span.attributes,
+    }
+    if exc is not None:
+        record["error"] = repr(exc)
+    line = json.dumps(record, default=str)
+    with _file_lock:
+        with open(_trace_file, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+def enabled() -> bool:
+    return _enabled
+
+def configure(enabled: bool = None, trace_file: str = None):
+    """
+    Turns tracing on or off and/or changes the JSONL file (None or "" to disable file export).
+    """
+    global _enabled, _trace_file
+    if enabled is not None:
+        _enabled = enabled
+    if trace_file is not None:
+        _trace_file = trace_file
+
+def span(name: str, **attributes):
+    """
+    Returns a context manager timing `name`; a shared no-op while tracing is disabled.
+    """
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+def current_span():
+    """
+    Returns the innermost active span, or the no-op span when there is none.
+    """
+    if not _enabled:
+        return NOOP_SPAN
+    return _current.get() or NOOP_SPAN
+
+def count(name: str, value: float = 1, **labels):
+    """
+    Adds value to a Prometheus counter (no-op while tracing is disabled).
+    """
+    if _enabled:
+        metrics.inc(name, value, labels)
+
+def observe(name: str, seconds: float, **labels):
+    """
+    Records a duration in a Prometheus histogram (no-op while tracing is disabled).
+    """
+    if _enabled:
+        metrics.observe(name, seconds, labels)
+
+def metrics_text() -> str:
+    """
+    Returns all metrics in the Prometheus text exposition format.
+    """
+    return metrics.render()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0"):
+    """
+    Serves /metrics on a background thread and returns the server.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,325 @@
+# vector_store.py
+
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+
+from config import NUMPY_IVF_LISTS, NUMPY_IVF_NPROBE, RETRIEVER_K
+
+# Rewrite the vector file once this fraction of its rows belongs to deleted chunks.
+COMPACT_RATIO = 0.25
+# IVF needs enough rows per list for k-means to be meaningful.
+IVF_MIN_ROWS_PER_LIST = 39
+# Retrain the coarse quantizer once the store has grown by this factor.
+IVF_RETRAIN_GROWTH = 2.0
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the indices of the k highest scores, best first.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+class NumpyRetriever:
+    """
+    Minimal LangChain-style retriever over a NumpyVectorStore.
+    """
+    def __init__(self, store, k: int = RETRIEVER_K):
+        self.store = store
+        self.k = k
+
+    def get_relevant_documents(self, query: str) -> list:
+        return self.store.similarity_search(query, k=self.k)
+
+    invoke = get_relevant_documents
+
+class NumpyVectorStore:
+    """
+    An in-process vector store: chunk vectors live in one contiguous, L2-normalized
+    float32 matrix that is memory-mapped from disk, so cosine top-k is a single
+    matmul plus argpartition. Chunk texts and metadata stay on disk in SQLite and
+    are only read for the hits of a query.
+
+    With ivf_lists > 0 a spherical k-means coarse quantizer partitions the rows and
+    queries only scan the nprobe closest lists, for large corpora.
+    """
+    def __init__(self, directory: str, embedding, ivf_lists: int = NUMPY_IVF_LISTS,
+                 nprobe: int = NUMPY_IVF_NPROBE):
+        self.directory = directory
+        self.embeddings = embedding
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._centroids_path = os.path.join(directory, "centroids.npy")
+        self._assignments_path = os.path.join(directory, "assignments.npy")
+        self._db = sqlite3.connect(os.path.join(directory, "chunks.sqlite3"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks "
+                         "(id TEXT PRIMARY KEY, row INTEGER, text TEXT, metadata TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_row ON chunks (row)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._lock = threading.RLock()
+
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        self._rows = int(meta.get("rows", 0))
+        self._dim = int(meta["dim"]) if "dim" in meta else None
+        self._trained_rows = int(meta.get("trained_rows", 0))
+        self._row_of = dict(self._db.execute("SELECT id, row FROM chunks"))
+        live = np.zeros(self._rows, dtype=bool)
+        # Row -> chunk id, so a search snapshot can resolve its hits even if rows move later.
+        self._ids = [None] * self._rows
+        for chunk_id, row in self._row_of.items():
+            live[row] = True
+            self._ids[row] = chunk_id
+        # Arrays below are replaced (or only appended to), never modified in place,
+        # so searches can work on a snapshot without holding the lock.
+        self._live = live
+        self._matrix = None
+        self._centroids = None
+        self._assignments = None
+        self._lists = None
+        if os.path.exists(self._centroids_path) and os.path.exists(self._assignments_path):
+            self._centroids = np.load(self._centroids_path)
+            self._assignments = np.load(self._assignments_path)[:self._rows]
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def close(self):
+        """
+        Releases the memory map and the database connection.
+        """
+        with self._lock:
+            self._matrix = None
+            self._db.close()
+
+    def _set_meta(self, **values):
+        self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [(key, str(value)) for key, value in values.items()])
+
+    def _load_matrix(self):
+        if self._matrix is None and self._rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                     shape=(self._rows, self._dim))
+        return self._matrix
+
+    def upsert(self, ids: list, texts: list, metadatas: list, vectors):
+        """
+        Adds pre-embedded chunks, replacing any existing chunks with the same ids.
+        """
+        if not ids:
+            return
+        vectors = _normalize(vectors)
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Expected {self._dim}-dimensional vectors, got {vectors.shape[1]}.")
+            self._delete_rows(ids)
+
+            start = self._rows
+            with open(self._vectors_path, "r+b" if os.path.exists(self._vectors_path) else "wb") as f:
+                f.seek(start * self._dim * 4)
+                f.write(vectors.tobytes())
+            rows = range(start, start + len(ids))
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, row, text, metadata) VALUES (?, ?, ?, ?)",
+                    [(chunk_id, row, text, json.dumps(meta or {}))
+                     for chunk_id, row, text, meta in zip(ids, rows, texts, metadatas)],
+                )
+                self._rows = start + len(ids)
+                self._set_meta(rows=self._rows, dim=self._dim)
+            self._row_of.update(zip(ids, rows))
+            self._ids.extend(ids)
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            if self._centroids is not None:
+                assigned = np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+                self._assignments = np.concatenate([self._assignments, assigned])
+                np.save(self._assignments_path, self._assignments)
+                self._lists = None
+            self._matrix = None
+
+    def add_documents(self, documents: list, ids: list):
+        """
+        Embeds and adds LangChain documents (same signature as the Chroma store).
+        """
+        texts = [doc.page_content for doc in documents]
+        vectors = self.embeddings.embed_documents(texts)
+        self.upsert(ids, texts, [doc.metadata for doc in documents], vectors)
+
+    def _delete_rows(self, ids: list):
+        rows = [self._row_of.pop(chunk_id) for chunk_id in ids if chunk_id in self._row_of]
+        if not rows:
+            return
+        live = self._live.copy()
+        live[rows] = False
+        self._live = live
+        with self._db:
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+
+    def delete(self, ids: list):
+        """
+        Removes chunks by id. The vector file is compacted once enough rows are dead.
+        """
+        with self._lock:
+            self._delete_rows(ids)
+            if self._rows and (self._rows - len(self._row_of)) / self._rows >= COMPACT_RATIO:
+                self.compact()
+
+    def compact(self):
+        """
+        Rewrites the vector file without the rows of deleted chunks.
+        """
+        with self._lock:
+            keep = np.flatnonzero(self._live)
+            matrix = self._load_matrix()
+            tmp_path = self._vectors_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(keep), 65536):
+                    f.write(np.ascontiguousarray(matrix[keep[start:start + 65536]]).tobytes())
+            self._matrix = None
+            del matrix
+            os.replace(tmp_path, self._vectors_path)
+
+            new_row = {int(old): new for new, old in enumerate(keep)}
+            with self._db:
+                # Rows only ever move down, in ascending order, so updates never collide.
+                updates = sorted((old, chunk_id) for chunk_id, old in self._row_of.items())
+                self._db.executemany("UPDATE chunks SET row = ? WHERE id = ?",
+                                     [(new_row[old], chunk_id) for old, chunk_id in updates])
+                self._rows = len(keep)
+                self._set_meta(rows=self._rows)
+            self._row_of = {chunk_id: new_row[old] for chunk_id, old in self._row_of.items()}
+            self._ids = [self._ids[old] for old in keep]
+            self._live = np.ones(self._rows, dtype=bool)
+            if self._assignments is not None:
+                self._assignments = self._assignments[keep]
+                np.save(self._assignments_path, self._assignments)
+                self._lists = None
+
+    def train_ivf(self, lists: int = None, iterations: int = 10, sample_size: int = 50000, seed: int = 0):
+        """
+        Trains the coarse quantizer (spherical k-means) and assigns every row to a list.
+        """
+        lists = lists or self.ivf_lists
+        with self._lock:
+            matrix = self._load_matrix()
+            live_rows = np.flatnonzero(self._live)
+            if matrix is None or len(live_rows) < lists:
+                return
+            rng = np.random.default_rng(seed)
+            sample = matrix[np.sort(rng.choice(live_rows, min(sample_size, len(live_rows)), replace=False))]
+            centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+            for _ in range(iterations):
+                assigned = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assigned, sample)
+                empty = np.flatnonzero(~sums.any(axis=1))
+                # Re-seed empty lists with random sample rows.
+                sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+                centroids = _normalize(sums)
+
+            assignments = np.empty(self._rows, dtype=np.int32)
+            for start in range(0, self._rows, 65536):
+                assignments[start:start + 65536] = np.argmax(matrix[start:start + 65536] @ centroids.T, axis=1)
+            np.save(self._centroids_path, centroids)
+            np.save(self._assignments_path, assignments)
+            self._centroids = centroids
+            self._assignments = assignments
+            self._lists = None
+            self._trained_rows = len(live_rows)
+            with self._db:
+                self._set_meta(trained_rows=self._trained_rows)
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind="stable")
+            bounds = np.searchsorted(self._assignments[order], np.arange(len(self._centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        return self._lists
+
+    def _maybe_train(self):
+        if not self.ivf_lists:
+            return
+        live = len(self._row_of)
+        if live < self.ivf_lists * IVF_MIN_ROWS_PER_LIST:
+            return
+        if self._centroids is None or live >= self._trained_rows * IVF_RETRAIN_GROWTH:
+            self.train_ivf()
+
+    def search(self, query_vector, k: int = RETRIEVER_K) -> list:
+        """
+        Returns up to k (id, text, metadata, score) tuples, best first, ranked by
+        cosine similarity to query_vector.
+        """
+        with self._lock:
+            self._maybe_train()
+            matrix = self._load_matrix()
+            live = self._live
+            row_ids = self._ids
+            lists = self._inverted_lists() if self.ivf_lists and self._centroids is not None else None
+            centroids = self._centroids
+        if matrix is None or not live.any():
+            return []
+
+        query = _normalize(query_vector)[0]
+        if lists is not None:
+            probe = _top_k(centroids @ query, self.nprobe)
+            candidates = np.concatenate([lists[i] for i in probe])
+            # Sorted row order keeps reads from the memory map sequential.
+            candidates = np.sort(candidates[live[candidates]])
+            scores = matrix[candidates] @ query
+        else:
+            scores = matrix @ query
+            scores[~live] = -np.inf
+            candidates = None
+        best = _top_k(scores, k)
+        best = best[np.isfinite(scores[best])]
+        rows = candidates[best] if candidates is not None else best
+        hit_ids = [row_ids[row] for row in rows.tolist()]
+        chunks = {chunk_id: (text, metadata) for chunk_id, text, metadata in self.get(hit_ids)}
+        return [(chunk_id, *chunks[chunk_id], score)
+                for chunk_id, score in zip(hit_ids, scores[best].tolist()) if chunk_id in chunks]
+
+    def get(self, ids: list) -> list:
+        """
+        Returns (id, text, metadata) for the given chunk ids that exist, in order.
+        """
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            found = {chunk_id: (chunk_id, text, json.loads(metadata)) for chunk_id, text, metadata in self._db.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", list(ids))}
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def similarity_search(self, query: str, k: int = RETRIEVER_K) -> list:
+        """
+        Embeds the query and returns the k most similar chunks as LangChain documents.
+        """
+        from langchain_core.documents import Document
+        hits = self.search(self.embeddings.embed_query(query), k)
+        return [Document(page_content=text, metadata=metadata) for _, text, metadata, _ in hits]
+
+    def as_retriever(self, search_kwargs: dict = None) -> NumpyRetriever:
+        """
+        Returns a retriever; accepts the same search_kwargs={"k": ...} as Chroma.
+        """
+        return NumpyRetriever(self, k=(search_kwargs or {}).get("k", RETRIEVER_K))